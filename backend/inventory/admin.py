@@ -1,14 +1,41 @@
 from django.contrib import admin
+from django.db.models import Count, Sum
 
 from inventory.models import AuditEvent, Dette, Envoi, Produit, Stock, TauxChange, Transaction
 
 
 @admin.register(Envoi)
 class EnvoiAdmin(admin.ModelAdmin):
-    list_display = ("nom", "date_debut", "date_fin", "is_archived", "created_at")
+    list_display = (
+        "nom",
+        "date_debut",
+        "date_fin",
+        "is_archived",
+        "n_produits",
+        "total_restant",
+        "created_at",
+    )
     search_fields = ("nom", "notes")
     list_filter = ("is_archived", "date_debut", "date_fin")
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                n_produits=Count("produits", distinct=True),
+                total_restant=Sum("produits__stock__quantite_restante"),
+            )
+        )
+
+    @admin.display(description="Produits", ordering="n_produits")
+    def n_produits(self, obj: Envoi) -> int:
+        return obj.n_produits
+
+    @admin.display(description="Stock restant", ordering="total_restant")
+    def total_restant(self, obj: Envoi) -> int:
+        return obj.total_restant or 0
+
 
 @admin.register(Produit)
 class ProduitAdmin(admin.ModelAdmin):
@@ -23,6 +50,7 @@ class ProduitAdmin(admin.ModelAdmin):
     )
     search_fields = ("nom", "categorie", "envoi__nom")
     list_filter = ("envoi", "categorie")
+    list_select_related = ("envoi",)
 
 
 @admin.register(Stock)
@@ -37,6 +65,22 @@ class StockAdmin(admin.ModelAdmin):
     )
     search_fields = ("produit__nom",)
     list_filter = ("produit__envoi",)
+    list_select_related = ("produit", "produit__envoi")
+    # Les compteurs sont tenus par deltas depuis les transactions et les dettes : une saisie
+    # manuelle servirait de base à tous les deltas suivants. Pour les réparer, passer par
+    # recalculate_stock_for_product(s) ou la commande sync_inventory_data.
+    readonly_fields = (
+        "produit",
+        "quantite_initial",
+        "quantite_vendue",
+        "quantite_pretee",
+        "quantite_restante",
+        "date_mise_a_jour",
+    )
+
+    def has_add_permission(self, request):
+        # Le stock est créé avec son produit (signal post_save).
+        return False
 
 
 @admin.register(Transaction)
@@ -53,12 +97,14 @@ class TransactionAdmin(admin.ModelAdmin):
     )
     list_filter = ("type_transaction", "date_transaction")
     search_fields = ("produit__nom", "produit__envoi__nom", "client_fournisseur", "notes")
+    list_select_related = ("produit", "produit__envoi")
 
 
 @admin.register(TauxChange)
 class TauxChangeAdmin(admin.ModelAdmin):
     list_display = ("date_application", "taux_euro_cfa", "utilisateur")
     list_filter = ("date_application",)
+    list_select_related = ("utilisateur",)
 
 
 @admin.register(Dette)
@@ -74,6 +120,7 @@ class DetteAdmin(admin.ModelAdmin):
     )
     list_filter = ("statut",)
     search_fields = ("produit__nom", "produit__envoi__nom", "client")
+    list_select_related = ("produit", "produit__envoi")
 
 
 @admin.register(AuditEvent)
@@ -81,3 +128,4 @@ class AuditEventAdmin(admin.ModelAdmin):
     list_display = ("created_at", "action", "entity", "object_id", "username", "envoi", "path")
     search_fields = ("username", "entity", "object_id", "object_repr", "message", "path")
     list_filter = ("action", "entity", "envoi", "created_at")
+    list_select_related = ("user", "envoi")
@@ -1,21 +1,141 @@
 from __future__ import annotations
 
+import atexit
+import threading
+from functools import partial
+from queue import Empty, SimpleQueue
+from time import monotonic
 from typing import Any
 
-from django.db import DatabaseError
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections
+from django.db import transaction as db_transaction
 from django.utils.encoding import force_str
 
 from inventory.models import AuditEvent
 
+_AUDIT_ENABLED = bool(getattr(settings, "AUDIT_ENABLED", True))
+_DISABLED_ACTIONS = frozenset(getattr(settings, "AUDIT_DISABLED_ACTIONS", ()) or ())
+
+_BATCH_SIZE = 200
+_FLUSH_INTERVAL = 0.5
+
+_queue: SimpleQueue = SimpleQueue()
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+
+
+def _write_batch(batch: list[AuditEvent]) -> None:
+    if not batch:
+        return
+    close_old_connections()
+    try:
+        with db_transaction.atomic():
+            AuditEvent.objects.bulk_create(batch, batch_size=500)
+    except Exception:  # noqa: BLE001
+        # Un événement invalide ne doit pas faire perdre tout le lot.
+        for event in batch:
+            try:
+                with db_transaction.atomic():
+                    event.save(force_insert=True)
+            except IntegrityError:
+                # L'envoi a pu être supprimé avant l'écriture (équivaut au SET_NULL).
+                event.envoi_id = None
+                try:
+                    event.save(force_insert=True)
+                except Exception:  # noqa: BLE001
+                    continue
+            except Exception:  # noqa: BLE001
+                continue
+    finally:
+        close_old_connections()
+
+
+def _writer_loop() -> None:
+    while True:
+        item = _queue.get()
+        batch: list[AuditEvent] = []
+        waiters: list[threading.Event] = []
+        deadline = monotonic() + _FLUSH_INTERVAL
+        while True:
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+                break
+            batch.append(item)
+            if len(batch) >= _BATCH_SIZE:
+                break
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = _queue.get(timeout=timeout)
+            except Empty:
+                break
+        _write_batch(batch)
+        for waiter in waiters:
+            waiter.set()
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="audit-writer", daemon=True)
+            _writer.start()
+
+
+def _enqueue(event: AuditEvent) -> None:
+    if not getattr(settings, "AUDIT_ASYNC", True):
+        _write_batch([event])
+        return
+    _ensure_writer()
+    _queue.put(event)
+
+
+def flush_audit_events(timeout: float = 5.0) -> None:
+    """Attend que les événements d'audit en file soient écrits en base."""
+    if _writer is None or not _writer.is_alive():
+        batch: list[AuditEvent] = []
+        while True:
+            try:
+                item = _queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(item, AuditEvent):
+                batch.append(item)
+        _write_batch(batch)
+        return
+    done = threading.Event()
+    _queue.put(done)
+    done.wait(timeout)
+
+
+atexit.register(flush_audit_events)
+
 
 def _get_client_ip(request) -> str:
-    meta = getattr(request, "META", {}) or {}
+    meta = getattr(request, "META", None) or {}
     xff = meta.get("HTTP_X_FORWARDED_FOR")
     if xff:
-        return str(xff).split(",")[0].strip()
+        return str(xff).partition(",")[0].strip()
     return str(meta.get("REMOTE_ADDR") or "").strip()
 
 
+def _object_repr(obj: Any) -> str:
+    # __str__ de Stock/Transaction/Dette lit produit.nom : ne pas déclencher de SELECT pour l'audit.
+    produit_field = getattr(type(obj), "produit", None)
+    is_cached = getattr(getattr(produit_field, "field", None), "is_cached", None)
+    if is_cached is None or is_cached(obj):
+        return force_str(obj)
+    return (
+        getattr(obj, "nom", None)
+        or getattr(obj, "username", None)
+        or f"{type(obj).__name__}#{getattr(obj, 'pk', '')}"
+    )
+
+
 def log_audit_event(
     request,
     *,
@@ -25,7 +145,11 @@ def log_audit_event(
     message: str = "",
     metadata: dict[str, Any] | None = None,
     envoi: Any | None = None,
+    object_repr: str | None = None,
 ) -> None:
+    # Ne pas construire un événement qui serait jeté.
+    if not _AUDIT_ENABLED or action in _DISABLED_ACTIONS:
+        return
     try:
         user = getattr(request, "user", None)
         username = ""
@@ -34,12 +158,6 @@ def log_audit_event(
             username = getattr(user, "get_username", lambda: "")() or getattr(user, "username", "") or ""
             user_fk = user
 
-        object_id = ""
-        object_repr = ""
-        if obj is not None:
-            object_id = str(getattr(obj, "pk", "") or "")
-            object_repr = force_str(obj)[:200]
-
         envoi_id = None
         if envoi is not None:
             envoi_id = getattr(envoi, "pk", None) or getattr(envoi, "id", None) or envoi
@@ -49,7 +167,14 @@ def log_audit_event(
                 produit = getattr(obj, "produit", None)
                 envoi_id = getattr(produit, "envoi_id", None) if produit is not None else None
 
-        AuditEvent.objects.create(
+        object_id = ""
+        if obj is not None:
+            object_id = str(getattr(obj, "pk", "") or "")
+            if object_repr is None:
+                object_repr = _object_repr(obj)
+        object_repr = (object_repr or "")[:200]
+
+        event = AuditEvent(
             user=user_fk,
             username=username,
             envoi_id=envoi_id,
@@ -61,8 +186,10 @@ def log_audit_event(
             path=str(getattr(request, "path", "") or "")[:300],
             method=str(getattr(request, "method", "") or "")[:10],
             ip_address=_get_client_ip(request)[:64],
-            metadata=metadata or {},
+            metadata={k: v for k, v in (metadata or {}).items() if v not in ("", [], {})},
         )
+        # Écrit hors du chemin de la requête, et jamais pour une transaction annulée.
+        db_transaction.on_commit(partial(_enqueue, event))
     except DatabaseError:
         # Ne jamais bloquer l'API si l'audit log est en panne.
         return
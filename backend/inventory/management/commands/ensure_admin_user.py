@@ -37,23 +37,22 @@ class Command(BaseCommand):
             )
 
         User = get_user_model()
-        user, created = User.objects.get_or_create(
-            username=username,
-            defaults={"email": email or ""},
+        user = (
+            User.objects.filter(username=username)
+            .only("id", "password", "is_staff", "is_superuser")
+            .first()
         )
-        if created:
-            user.is_staff = True
-            user.is_superuser = True
+        if user is None:
+            user = User(username=username, email=email or "", is_staff=True, is_superuser=True)
             user.set_password(password)
-            user.save(update_fields=["is_staff", "is_superuser", "password", "email"])
+            user.save()
             self.stdout.write(self.style.SUCCESS(f"Created admin user: {username}"))
             return
 
         if not user.is_superuser or not user.is_staff:
-            user.is_staff = True
-            user.is_superuser = True
-            user.save(update_fields=["is_staff", "is_superuser"])
+            User.objects.filter(pk=user.pk).update(is_staff=True, is_superuser=True)
 
+        # Le hachage du mot de passe (KDF) n'est calculé que si la mise à jour est demandée.
         if update_password and not user.check_password(password):
             user.set_password(password)
             user.save(update_fields=["password"])
@@ -4,10 +4,13 @@ from datetime import datetime, time
 
 from django.core.management.base import BaseCommand
 from django.db import transaction as db_transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, TextField, Value, When
 from django.utils import timezone
 
 from inventory.models import Dette, Produit, Transaction
-from inventory.services import recalculate_stock_for_product
+from inventory.services import recalculate_stock_for_products
+
+_CHUNK_SIZE = 2000
 
 
 class Command(BaseCommand):
@@ -19,16 +22,34 @@ class Command(BaseCommand):
         converted_transactions = 0
         deleted_retours = 0
 
-        with db_transaction.atomic():
-            debts = Dette.objects.select_related("transaction_pret", "transaction_retour").all()
+        # Une seule transaction pour tout le traitement (erreur si déjà dans un atomic).
+        with db_transaction.atomic(durable=True):
+            debts_to_unlink: list[Dette] = []
+            retour_ids: list[int] = []
+            tx_to_update: list[Transaction] = []
+            tx_fields: set[str] = set()
+
+            debts = Dette.objects.select_related("transaction_pret").only(
+                "id",
+                "client",
+                "date_pret",
+                "date_retour_effective",
+                "transaction_retour",
+                "transaction_pret",
+                "transaction_pret__id",
+                "transaction_pret__type_transaction",
+                "transaction_pret__date_transaction",
+                "transaction_pret__client_fournisseur",
+                "transaction_pret__prix_unitaire_euro",
+                "transaction_pret__taux_change",
+                "transaction_pret__notes",
+            )
+            tz = timezone.get_current_timezone()
             for debt in debts:
                 if debt.transaction_retour_id is not None:
-                    tx_retour = debt.transaction_retour
+                    retour_ids.append(debt.transaction_retour_id)
                     debt.transaction_retour = None
-                    debt.save(update_fields=["transaction_retour"])
-                    if tx_retour is not None:
-                        tx_retour.delete()
-                        deleted_retours += 1
+                    debts_to_unlink.append(debt)
 
                 tx = debt.transaction_pret
                 if tx is None:
@@ -45,7 +66,7 @@ class Command(BaseCommand):
                     update_fields.append("type_transaction")
 
                 tx_date = debt.date_retour_effective if debt.date_retour_effective else debt.date_pret
-                tx_at = timezone.make_aware(datetime.combine(tx_date, time.min))
+                tx_at = datetime.combine(tx_date, time.min, tzinfo=tz)
                 if tx.date_transaction != tx_at:
                     tx.date_transaction = tx_at
                     update_fields.append("date_transaction")
@@ -67,48 +88,70 @@ class Command(BaseCommand):
                     update_fields.append("notes")
 
                 if update_fields:
-                    tx.save(update_fields=update_fields)
+                    tx_to_update.append(tx)
+                    tx_fields.update(update_fields)
                     updated_debts += 1
 
-            orphan_retours = Transaction.objects.filter(
+            if debts_to_unlink:
+                Dette.objects.bulk_update(debts_to_unlink, ["transaction_retour"], batch_size=500)
+            if retour_ids:
+                deleted_retours += Transaction.objects.filter(id__in=retour_ids).delete()[1].get(
+                    "inventory.Transaction", 0
+                )
+            if tx_to_update:
+                Transaction.objects.bulk_update(tx_to_update, sorted(tx_fields), batch_size=500)
+
+            _total, deleted_by_model = Transaction.objects.filter(
                 type_transaction=Transaction.TypeTransaction.RETOUR
-            )
-            deleted_retours += orphan_retours.count()
-            orphan_retours.delete()
+            ).delete()
+            deleted_retours += deleted_by_model.get("inventory.Transaction", 0)
 
-            linked_tx_ids = set(
-                Dette.objects.exclude(transaction_pret__isnull=True).values_list(
-                    "transaction_pret_id", flat=True
-                )
-            )
             legacy_prets = Transaction.objects.filter(
                 type_transaction=Transaction.TypeTransaction.PRET
-            ).select_related("produit")
-            for tx in legacy_prets:
-                tx.prix_unitaire_euro = None
-                tx.taux_change = None
-                if not tx.notes:
-                    tx.notes = "Dette (legacy)"
-                tx.save(update_fields=["prix_unitaire_euro", "taux_change", "notes"])
-
-                if tx.id in linked_tx_ids:
-                    continue
+            )
+            legacy_prets.filter(
+                Q(prix_unitaire_euro__isnull=False) | Q(taux_change__isnull=False) | Q(notes="")
+            ).update(
+                prix_unitaire_euro=None,
+                taux_change=None,
+                notes=Case(
+                    When(notes="", then=Value("Dette (legacy)")),
+                    default=F("notes"),
+                    output_field=TextField(),
+                ),
+            )
 
-                created = Dette.objects.create(
-                    produit=tx.produit,
-                    client=tx.client_fournisseur or "Inconnu",
-                    quantite_pretee=tx.quantite,
-                    date_pret=timezone.localtime(tx.date_transaction).date(),
+            new_debts: list[Dette] = []
+            unlinked_prets = legacy_prets.filter(
+                ~Exists(Dette.objects.filter(transaction_pret_id=OuterRef("pk")))
+            ).values_list("id", "produit_id", "client_fournisseur", "quantite", "date_transaction")
+            for tx_id, produit_id, client, quantite, date_transaction in unlinked_prets.iterator(
+                chunk_size=_CHUNK_SIZE
+            ):
+                new_debts.append(Dette(
+                    produit_id=produit_id,
+                    client=client or "Inconnu",
+                    quantite_pretee=quantite,
+                    date_pret=timezone.localtime(date_transaction).date(),
                     date_retour_prevue=None,
                     date_retour_effective=None,
                     statut=Dette.Statut.EN_COURS,
-                    transaction_pret=tx,
-                )
-                created_debts += 1
-
-        products = list(Produit.objects.values_list("id", flat=True))
-        for pid in products:
-            recalculate_stock_for_product(pid)
+                    transaction_pret_id=tx_id,
+                ))
+                if len(new_debts) >= _CHUNK_SIZE:
+                    created_debts += len(Dette.objects.bulk_create(new_debts))
+                    new_debts.clear()
+            if new_debts:
+                created_debts += len(Dette.objects.bulk_create(new_debts))
+
+            recalculated_products = 0
+            product_ids: list[int] = []
+            for pid in Produit.objects.values_list("id", flat=True).iterator(chunk_size=_CHUNK_SIZE):
+                product_ids.append(pid)
+                if len(product_ids) >= _CHUNK_SIZE:
+                    recalculated_products += recalculate_stock_for_products(product_ids)
+                    product_ids.clear()
+            recalculated_products += recalculate_stock_for_products(product_ids)
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -117,6 +160,6 @@ class Command(BaseCommand):
                 f"created_debts={created_debts}, "
                 f"converted_transactions={converted_transactions}, "
                 f"deleted_retours={deleted_retours}, "
-                f"recalculated_products={len(products)}"
+                f"recalculated_products={recalculated_products}"
             )
         )
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def tune_metadata_storage(apps, schema_editor):  # noqa: ARG001
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE inventory_auditevent ALTER COLUMN metadata SET STORAGE EXTENDED"
+    )
+    schema_editor.execute("ALTER TABLE inventory_auditevent SET (toast_tuple_target = 128)")
+
+
+def reset_metadata_storage(apps, schema_editor):  # noqa: ARG001
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("ALTER TABLE inventory_auditevent RESET (toast_tuple_target)")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventory", "0007_auditevent_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(tune_metadata_storage, reset_metadata_storage),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventory", "0008_auditevent_metadata_storage"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(type_transaction="pret"),
+                fields=["id"],
+                name="tx_pret_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(type_transaction="retour"),
+                fields=["id"],
+                name="tx_retour_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventory", "0009_transaction_type_partial_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["produit", "type_transaction"], name="tx_produit_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="dette",
+            index=models.Index(
+                condition=models.Q(date_retour_effective__isnull=True),
+                fields=["produit"],
+                name="idx_dette_open",
+            ),
+        ),
+    ]
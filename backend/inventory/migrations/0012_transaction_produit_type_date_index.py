@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventory", "0011_auditevent_envoi_id_index"),
+    ]
+
+    operations = [
+        # Même préfixe (produit, type_transaction) : l'ancien index devient redondant.
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["produit", "type_transaction", "date_transaction", "id"],
+                name="tx_produit_type_date_idx",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="tx_produit_type_idx",
+        ),
+    ]
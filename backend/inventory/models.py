@@ -104,6 +104,22 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ["-date_transaction", "-id"]
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(type_transaction="pret"),
+                name="tx_pret_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(type_transaction="retour"),
+                name="tx_retour_idx",
+            ),
+            models.Index(
+                fields=["produit", "type_transaction", "date_transaction", "id"],
+                name="tx_produit_type_date_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.type_transaction} - {self.produit.nom} x{self.quantite}"
@@ -166,6 +182,13 @@ class Dette(models.Model):
 
     class Meta:
         ordering = ["-date_pret", "-id"]
+        indexes = [
+            models.Index(
+                fields=["produit"],
+                condition=models.Q(date_retour_effective__isnull=True),
+                name="idx_dette_open",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Dette({self.client} - {self.produit.nom} x{self.quantite_pretee})"
@@ -209,6 +232,13 @@ class AuditEvent(models.Model):
 
     class Meta:
         ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="audit_created_desc"),
+            models.Index(fields=["action", "-created_at"], name="audit_action_created"),
+            models.Index(fields=["entity", "object_id"], name="audit_entity_object"),
+            models.Index(fields=["envoi", "-created_at"], name="audit_envoi_created"),
+            models.Index(fields=["envoi", "id"], name="audit_envoi_id"),
+        ]
 
     def __str__(self) -> str:
         who = self.username or (self.user.username if self.user_id else "")
@@ -1,15 +1,41 @@
 from __future__ import annotations
 
+import copy
 from datetime import date, datetime, time
 from decimal import Decimal
 
 from django.db import transaction as db_transaction
-from django.db.models import Sum
+from django.db.models import Q, Sum
 from django.utils import timezone
 from rest_framework import serializers
 
 from inventory.models import AuditEvent, Dette, Envoi, Produit, Stock, TauxChange, Transaction
-from inventory.services import get_current_exchange_rate, recalculate_stock_for_product
+from inventory.services import (
+    apply_stock_delta,
+    disable_stock_recalc,
+    get_current_exchange_rate,
+    recalculate_stock_for_product,
+)
+
+_Q2 = Decimal("0.01")
+
+
+def _start_of_day(day: date) -> datetime:
+    # Équivalent à make_aware(datetime.combine(...)) : aucune timezone n'est activée par requête.
+    return datetime.combine(day, time.min, tzinfo=timezone.get_default_timezone())
+
+
+class CachedFieldsModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer dont les champs ne sont construits qu'une fois par classe."""
+
+    def get_fields(self):
+        cls = type(self)
+        fields = cls.__dict__.get("_cached_fields")
+        if fields is None:
+            fields = super().get_fields()
+            cls._cached_fields = fields
+        # Les champs sont liés à chaque instance (bind) : on ne partage que des copies.
+        return copy.deepcopy(fields)
 
 
 class StockSerializer(serializers.ModelSerializer):
@@ -27,7 +53,7 @@ class StockSerializer(serializers.ModelSerializer):
         read_only_fields = ("id", "date_mise_a_jour")
 
 
-class ProduitSerializer(serializers.ModelSerializer):
+class ProduitSerializer(CachedFieldsModelSerializer):
     stock = StockSerializer(read_only=True)
 
     class Meta:
@@ -62,7 +88,7 @@ class ProduitSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(CachedFieldsModelSerializer):
     total_euro = serializers.SerializerMethodField()
     total_cfa = serializers.SerializerMethodField()
 
@@ -84,20 +110,31 @@ class TransactionSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("id", "total_euro", "total_cfa")
 
+    def _current_rate(self) -> Decimal | None:
+        # Le contexte est partagé avec le ListSerializer parent : une seule requête pour many=True.
+        context = self.context
+        if "_rate" not in context:
+            context["_rate"] = get_current_exchange_rate()
+        return context["_rate"]
+
     def get_total_euro(self, obj: Transaction) -> Decimal | None:
+        if hasattr(obj, "total_euro_db"):
+            return obj.total_euro_db
         if obj.prix_unitaire_euro is None:
             return None
-        return Decimal(obj.quantite) * obj.prix_unitaire_euro
+        return obj.quantite * obj.prix_unitaire_euro
 
     def get_total_cfa(self, obj: Transaction) -> Decimal | None:
+        if hasattr(obj, "total_cfa_db"):
+            return obj.total_cfa_db
         if obj.prix_unitaire_cfa is not None:
-            return Decimal(obj.quantite) * obj.prix_unitaire_cfa
+            return obj.quantite * obj.prix_unitaire_cfa
         if obj.prix_unitaire_euro is None:
             return None
-        taux = obj.taux_change or get_current_exchange_rate()
+        taux = obj.taux_change or self._current_rate()
         if taux is None:
             return None
-        return Decimal(obj.quantite) * obj.prix_unitaire_euro * taux
+        return obj.quantite * obj.prix_unitaire_euro * taux
 
     def validate(self, attrs):
         instance: Transaction | None = getattr(self, "instance", None)
@@ -129,18 +166,12 @@ class TransactionSerializer(serializers.ModelSerializer):
         if instance is not None:
             qs = qs.exclude(pk=instance.pk)
 
-        achats = (
-            qs.filter(type_transaction=Transaction.TypeTransaction.ACHAT).aggregate(
-                total=Sum("quantite")
-            )["total"]
-            or 0
-        )
-        ventes = (
-            qs.filter(type_transaction=Transaction.TypeTransaction.VENTE).aggregate(
-                total=Sum("quantite")
-            )["total"]
-            or 0
+        totals = qs.aggregate(
+            achats=Sum("quantite", filter=Q(type_transaction=Transaction.TypeTransaction.ACHAT)),
+            ventes=Sum("quantite", filter=Q(type_transaction=Transaction.TypeTransaction.VENTE)),
         )
+        achats = totals["achats"] or 0
+        ventes = totals["ventes"] or 0
         dettes_en_cours = (
             Dette.objects.filter(produit_id=produit.id, date_retour_effective__isnull=True).aggregate(
                 total=Sum("quantite_pretee")
@@ -173,12 +204,10 @@ class TransactionSerializer(serializers.ModelSerializer):
         taux_change = attrs.get("taux_change")
 
         if prix_unitaire_euro is not None and prix_unitaire_cfa is None:
-            taux = taux_change or get_current_exchange_rate()
+            taux = taux_change or self._current_rate()
             if taux is not None:
                 attrs["taux_change"] = taux
-                attrs["prix_unitaire_cfa"] = (prix_unitaire_euro * taux).quantize(
-                    Decimal("0.01")
-                )
+                attrs["prix_unitaire_cfa"] = (prix_unitaire_euro * taux).quantize(_Q2)
 
         effective_prix_cfa = (
             attrs["prix_unitaire_cfa"]
@@ -190,7 +219,7 @@ class TransactionSerializer(serializers.ModelSerializer):
             if effective_prix_cfa is None:
                 default_price = getattr(produit, "prix_vente_unitaire_cfa", None)
                 if default_price is not None:
-                    attrs["prix_unitaire_cfa"] = default_price.quantize(Decimal("0.01"))
+                    attrs["prix_unitaire_cfa"] = default_price.quantize(_Q2)
                     return attrs
                 raise serializers.ValidationError(
                     {"prix_unitaire_cfa": "Prix de vente requis (CFA)."}
@@ -199,7 +228,7 @@ class TransactionSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class AuditEventSerializer(serializers.ModelSerializer):
+class AuditEventSerializer(CachedFieldsModelSerializer):
     user_display = serializers.SerializerMethodField()
     envoi_nom = serializers.SerializerMethodField()
 
@@ -226,6 +255,9 @@ class AuditEventSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_user_display(self, obj: AuditEvent) -> str:
+        full_name = getattr(obj, "user_full_name", None)
+        if full_name is not None:
+            return full_name or obj.username or obj.user_username
         user = obj.user
         if user and (getattr(user, "first_name", "") or getattr(user, "last_name", "")):
             name = f"{getattr(user, 'first_name', '')} {getattr(user, 'last_name', '')}".strip()
@@ -333,24 +365,27 @@ class DetteSerializer(serializers.ModelSerializer):
             date_retour_effective=validated_data.get("date_retour_effective"),
             date_retour_prevue=validated_data.get("date_retour_prevue"),
         )
-        dette = super().create(validated_data)
-
-        is_paid = dette.date_retour_effective is not None
-        tx_date = dette.date_retour_effective if is_paid else dette.date_pret
-        tx_at = timezone.make_aware(datetime.combine(tx_date, time.min))
-        tx = Transaction.objects.create(
-            produit=produit,
-            type_transaction=Transaction.TypeTransaction.VENTE
-            if is_paid
-            else Transaction.TypeTransaction.PRET,
-            quantite=quantite,
-            prix_unitaire_cfa=prix_unitaire_cfa,
-            client_fournisseur=dette.client,
-            date_transaction=tx_at,
-            notes=f"Dette #{dette.id} ({'payee' if is_paid else 'non payee'})",
-        )
-        dette.transaction_pret = tx
-        dette.save(update_fields=["transaction_pret"])
+        # Stock déjà recalculé ci-dessus : un seul ajustement à la fin plutôt qu'un par signal.
+        with disable_stock_recalc():
+            dette = super().create(validated_data)
+
+            is_paid = dette.date_retour_effective is not None
+            tx_date = dette.date_retour_effective if is_paid else dette.date_pret
+            tx_at = _start_of_day(tx_date)
+            tx = Transaction.objects.create(
+                produit=produit,
+                type_transaction=Transaction.TypeTransaction.VENTE
+                if is_paid
+                else Transaction.TypeTransaction.PRET,
+                quantite=quantite,
+                prix_unitaire_cfa=prix_unitaire_cfa,
+                client_fournisseur=dette.client,
+                date_transaction=tx_at,
+                notes=f"Dette #{dette.id} ({'payee' if is_paid else 'non payee'})",
+            )
+            dette.transaction_pret = tx
+            dette.save(update_fields=["transaction_pret"])
+        apply_stock_delta(produit.id, **({"ventes": quantite} if is_paid else {"dettes": quantite}))
         return dette
 
     @db_transaction.atomic
@@ -382,16 +417,34 @@ class DetteSerializer(serializers.ModelSerializer):
             date_retour_prevue=date_retour_prevue,
         )
 
+        # Un seul recalcul du stock à la fin plutôt qu'un par signal.
+        with disable_stock_recalc():
+            instance = self._update_debt(
+                instance,
+                validated_data,
+                prix_unitaire_cfa=prix_unitaire_cfa,
+                date_retour_effective=date_retour_effective,
+            )
+        recalculate_stock_for_product(instance.produit_id)
+        return instance
+
+    def _update_debt(
+        self,
+        instance: Dette,
+        validated_data,
+        *,
+        prix_unitaire_cfa: Decimal | None,
+        date_retour_effective: date | None,
+    ) -> Dette:
         is_paid = date_retour_effective is not None
 
+        tx_retour_id = instance.transaction_retour_id
+        if tx_retour_id is not None:
+            # Détaché dans le même UPDATE que les autres champs de la dette.
+            validated_data["transaction_retour"] = None
         instance = super().update(instance, validated_data)
-
-        if instance.transaction_retour_id is not None:
-            tx_retour = instance.transaction_retour
-            instance.transaction_retour = None
-            instance.save(update_fields=["transaction_retour"])
-            if tx_retour:
-                tx_retour.delete()
+        if tx_retour_id is not None:
+            Transaction.objects.filter(pk=tx_retour_id).delete()
 
         tx = instance.transaction_pret
         if tx is None:
@@ -405,9 +458,9 @@ class DetteSerializer(serializers.ModelSerializer):
                 )
 
             tx_date = date_retour_effective if is_paid else instance.date_pret
-            tx_at = timezone.make_aware(datetime.combine(tx_date, time.min))
+            tx_at = _start_of_day(tx_date)
             tx = Transaction.objects.create(
-                produit=instance.produit,
+                produit_id=instance.produit_id,
                 type_transaction=Transaction.TypeTransaction.VENTE
                 if is_paid
                 else Transaction.TypeTransaction.PRET,
@@ -441,7 +494,7 @@ class DetteSerializer(serializers.ModelSerializer):
             update_fields.append("client_fournisseur")
 
         tx_date = date_retour_effective if is_paid else instance.date_pret
-        tx_at = timezone.make_aware(datetime.combine(tx_date, time.min))
+        tx_at = _start_of_day(tx_date)
         if tx.date_transaction != tx_at:
             tx.date_transaction = tx_at
             update_fields.append("date_transaction")
@@ -463,7 +516,7 @@ class DetteSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     {"prix_unitaire_cfa": "Prix de vente requis (CFA) pour une dette client."}
                 )
-            tx.prix_unitaire_cfa = default_price.quantize(Decimal("0.01"))
+            tx.prix_unitaire_cfa = default_price.quantize(_Q2)
             update_fields.append("prix_unitaire_cfa")
 
         desired_notes = f"Dette #{instance.id} ({'payee' if is_paid else 'non payee'})"
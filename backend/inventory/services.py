@@ -4,13 +4,22 @@ from contextlib import contextmanager
 from decimal import Decimal
 from threading import local
 
-from django.db.models import Sum
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Greatest
 from django.utils import timezone
 
-from inventory.models import Dette, Stock, TauxChange, Transaction
+from inventory.models import Dette, Produit, Stock, TauxChange, Transaction
 
 _state = local()
 
+_STOCK_FIELDS = [
+    "quantite_initial",
+    "quantite_vendue",
+    "quantite_pretee",
+    "quantite_restante",
+    "date_mise_a_jour",
+]
+
 
 def is_stock_recalc_disabled() -> bool:
     return bool(getattr(_state, "disable_stock_recalc", False))
@@ -26,6 +35,24 @@ def disable_stock_recalc():
         _state.disable_stock_recalc = previous
 
 
+def apply_stock_delta(produit_id: int | None, *, achats: int = 0, ventes: int = 0, dettes: int = 0) -> None:
+    if not produit_id or not (achats or ventes or dettes):
+        return
+    # Mise à jour incrémentale : évite de re-sommer tout l'historique du produit à chaque écriture.
+    updated = Stock.objects.filter(produit_id=produit_id).update(
+        quantite_initial=F("quantite_initial") + achats,
+        quantite_vendue=F("quantite_vendue") + ventes,
+        quantite_pretee=F("quantite_pretee") + dettes,
+        quantite_restante=Greatest(
+            F("quantite_initial") + achats - F("quantite_vendue") - ventes - F("quantite_pretee") - dettes,
+            0,
+        ),
+        date_mise_a_jour=timezone.now(),
+    )
+    if not updated:
+        recalculate_stock_for_products([produit_id])
+
+
 def get_current_exchange_rate() -> Decimal | None:
     current = TauxChange.objects.order_by("-date_application", "-id").first()
     if not current:
@@ -34,20 +61,12 @@ def get_current_exchange_rate() -> Decimal | None:
 
 
 def recalculate_stock_for_product(produit_id: int) -> Stock:
-    achats = (
-        Transaction.objects.filter(
-            produit_id=produit_id,
-            type_transaction=Transaction.TypeTransaction.ACHAT,
-        ).aggregate(total=Sum("quantite"))["total"]
-        or 0
-    )
-    ventes = (
-        Transaction.objects.filter(
-            produit_id=produit_id,
-            type_transaction=Transaction.TypeTransaction.VENTE,
-        ).aggregate(total=Sum("quantite"))["total"]
-        or 0
+    totals = Transaction.objects.filter(produit_id=produit_id).aggregate(
+        achats=Sum("quantite", filter=Q(type_transaction=Transaction.TypeTransaction.ACHAT)),
+        ventes=Sum("quantite", filter=Q(type_transaction=Transaction.TypeTransaction.VENTE)),
     )
+    achats = totals["achats"] or 0
+    ventes = totals["ventes"] or 0
     dettes_en_cours = (
         Dette.objects.filter(
             produit_id=produit_id,
@@ -58,19 +77,105 @@ def recalculate_stock_for_product(produit_id: int) -> Stock:
 
     quantite_restante = max(achats - ventes - dettes_en_cours, 0)
 
-    stock, _created = Stock.objects.get_or_create(produit_id=produit_id)
-    stock.quantite_initial = achats
-    stock.quantite_vendue = ventes
-    stock.quantite_pretee = dettes_en_cours
-    stock.quantite_restante = quantite_restante
-    stock.date_mise_a_jour = timezone.now()
-    stock.save(
-        update_fields=[
-            "quantite_initial",
-            "quantite_vendue",
-            "quantite_pretee",
-            "quantite_restante",
-            "date_mise_a_jour",
-        ]
+    stock = Stock.objects.filter(produit_id=produit_id).first()
+    if stock is not None:
+        if (
+            stock.quantite_initial,
+            stock.quantite_vendue,
+            stock.quantite_pretee,
+            stock.quantite_restante,
+        ) == (achats, ventes, dettes_en_cours, quantite_restante):
+            # Rien n'a changé : pas d'écriture.
+            return stock
+        stock.quantite_initial = achats
+        stock.quantite_vendue = ventes
+        stock.quantite_pretee = dettes_en_cours
+        stock.quantite_restante = quantite_restante
+        stock.date_mise_a_jour = timezone.now()
+        stock.save(update_fields=_STOCK_FIELDS)
+        return stock
+
+    stock = Stock(
+        produit_id=produit_id,
+        quantite_initial=achats,
+        quantite_vendue=ventes,
+        quantite_pretee=dettes_en_cours,
+        quantite_restante=quantite_restante,
+        date_mise_a_jour=timezone.now(),
+    )
+    # Upsert en une seule requête (INSERT ... ON CONFLICT DO UPDATE).
+    Stock.objects.bulk_create(
+        [stock],
+        update_conflicts=True,
+        unique_fields=["produit"],
+        update_fields=_STOCK_FIELDS,
     )
     return stock
+
+
+def recalculate_stock_for_products(produit_ids) -> int:
+    produit_ids = set(produit_ids)
+    if not produit_ids:
+        return 0
+
+    # Même calcul que recalculate_stock_for_product, mais en requêtes groupées.
+    achats: dict[int, int] = {}
+    ventes: dict[int, int] = {}
+    tx_totals = (
+        Transaction.objects.filter(
+            produit_id__in=produit_ids,
+            type_transaction__in=[
+                Transaction.TypeTransaction.ACHAT,
+                Transaction.TypeTransaction.VENTE,
+            ],
+        )
+        .values("produit_id", "type_transaction")
+        .annotate(total=Sum("quantite"))
+        .order_by()
+    )
+    for row in tx_totals:
+        target = achats if row["type_transaction"] == Transaction.TypeTransaction.ACHAT else ventes
+        target[row["produit_id"]] = row["total"] or 0
+
+    dettes_en_cours = {
+        row["produit_id"]: row["total"] or 0
+        for row in Dette.objects.filter(
+            produit_id__in=produit_ids,
+            date_retour_effective__isnull=True,
+        )
+        .values("produit_id")
+        .annotate(total=Sum("quantite_pretee"))
+        .order_by()
+    }
+
+    stocks = {s.produit_id: s for s in Stock.objects.filter(produit_id__in=produit_ids)}
+    missing = produit_ids - stocks.keys()
+    if missing:
+        missing = set(Produit.objects.filter(id__in=missing).values_list("id", flat=True))
+    if missing:
+        Stock.objects.bulk_create([Stock(produit_id=pid) for pid in missing], ignore_conflicts=True)
+        stocks.update({s.produit_id: s for s in Stock.objects.filter(produit_id__in=missing)})
+
+    now = timezone.now()
+    changed: list[Stock] = []
+    for pid, stock in stocks.items():
+        initial = achats.get(pid, 0)
+        vendue = ventes.get(pid, 0)
+        pretee = dettes_en_cours.get(pid, 0)
+        restante = max(initial - vendue - pretee, 0)
+        if (
+            stock.quantite_initial,
+            stock.quantite_vendue,
+            stock.quantite_pretee,
+            stock.quantite_restante,
+        ) == (initial, vendue, pretee, restante):
+            continue
+        stock.quantite_initial = initial
+        stock.quantite_vendue = vendue
+        stock.quantite_pretee = pretee
+        stock.quantite_restante = restante
+        stock.date_mise_a_jour = now
+        changed.append(stock)
+    if changed:
+        Stock.objects.bulk_update(changed, _STOCK_FIELDS, batch_size=1000)
+    return len(stocks)
@@ -4,12 +4,14 @@ from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 from inventory.models import Dette, Produit, Stock, Transaction
-from inventory.services import is_stock_recalc_disabled, recalculate_stock_for_product
+from inventory.services import apply_stock_delta, is_stock_recalc_disabled
 
 
 @receiver(post_save, sender=Produit)
-def ensure_stock_exists(sender, instance: Produit, **kwargs):  # noqa: ARG001
-    Stock.objects.get_or_create(produit=instance)
+def ensure_stock_exists(sender, instance: Produit, created: bool, **kwargs):  # noqa: ARG001
+    if created:
+        # Produit tout juste inséré : aucun stock ne peut exister, un INSERT suffit.
+        Stock.objects.create(produit=instance)
 
 
 @receiver(pre_save, sender=Produit)
@@ -18,13 +20,7 @@ def produit_pre_save(sender, instance: Produit, **kwargs):  # noqa: ARG001
         instance._old_image_name = None  # type: ignore[attr-defined]
         return
 
-    try:
-        old = Produit.objects.get(pk=instance.pk)
-    except Produit.DoesNotExist:
-        instance._old_image_name = None  # type: ignore[attr-defined]
-        return
-
-    old_name = old.image.name if getattr(old, "image", None) else None
+    old_name = Produit.objects.filter(pk=instance.pk).values_list("image", flat=True).first() or None
     new_name = instance.image.name if getattr(instance, "image", None) else None
     instance._old_image_name = old_name if old_name and old_name != new_name else None  # type: ignore[attr-defined]
 
@@ -49,50 +45,96 @@ def produit_post_delete(sender, instance: Produit, **kwargs):  # noqa: ARG001
         pass
 
 
+def _transaction_delta(type_transaction: str, quantite: int) -> dict[str, int]:
+    if type_transaction == Transaction.TypeTransaction.ACHAT:
+        return {"achats": quantite}
+    if type_transaction == Transaction.TypeTransaction.VENTE:
+        return {"ventes": quantite}
+    return {}
+
+
+def _apply_stock_change(old: tuple[int, dict[str, int]] | None, new: tuple[int, dict[str, int]] | None) -> None:
+    deltas: dict[int, dict[str, int]] = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        produit_id, delta = state
+        target = deltas.setdefault(produit_id, {})
+        for key, value in delta.items():
+            target[key] = target.get(key, 0) + sign * value
+    for produit_id, delta in deltas.items():
+        apply_stock_delta(produit_id, **delta)
+
+
 @receiver(pre_save, sender=Transaction)
 def transaction_pre_save(sender, instance: Transaction, **kwargs):  # noqa: ARG001
+    instance._old_stock_state = None  # type: ignore[attr-defined]
     if not instance.pk:
-        instance._old_produit_id = None  # type: ignore[attr-defined]
         return
 
-    try:
-        old = Transaction.objects.get(pk=instance.pk)
-    except Transaction.DoesNotExist:
-        instance._old_produit_id = None  # type: ignore[attr-defined]
-        return
-
-    instance._old_produit_id = old.produit_id  # type: ignore[attr-defined]
+    old = (
+        Transaction.objects.filter(pk=instance.pk)
+        .values_list("produit_id", "type_transaction", "quantite")
+        .first()
+    )
+    if old is not None:
+        instance._old_stock_state = (old[0], _transaction_delta(old[1], old[2]))  # type: ignore[attr-defined]
 
 
 @receiver(post_save, sender=Transaction)
 def transaction_post_save(sender, instance: Transaction, **kwargs):  # noqa: ARG001
     if is_stock_recalc_disabled():
         return
-    produit_ids = {instance.produit_id}
-    old_id = getattr(instance, "_old_produit_id", None)
-    if old_id and old_id != instance.produit_id:
-        produit_ids.add(old_id)
-
-    for produit_id in produit_ids:
-        recalculate_stock_for_product(produit_id)
+    _apply_stock_change(
+        getattr(instance, "_old_stock_state", None),
+        (instance.produit_id, _transaction_delta(instance.type_transaction, instance.quantite)),
+    )
 
 
 @receiver(post_delete, sender=Transaction)
 def transaction_post_delete(sender, instance: Transaction, **kwargs):  # noqa: ARG001
     if is_stock_recalc_disabled():
         return
-    recalculate_stock_for_product(instance.produit_id)
+    _apply_stock_change(
+        (instance.produit_id, _transaction_delta(instance.type_transaction, instance.quantite)),
+        None,
+    )
+
+
+def _dette_delta(quantite_pretee: int, date_retour_effective) -> dict[str, int]:
+    return {} if date_retour_effective else {"dettes": quantite_pretee}
+
+
+@receiver(pre_save, sender=Dette)
+def dette_pre_save(sender, instance: Dette, **kwargs):  # noqa: ARG001
+    instance._old_stock_state = None  # type: ignore[attr-defined]
+    if not instance.pk:
+        return
+
+    old = (
+        Dette.objects.filter(pk=instance.pk)
+        .values_list("produit_id", "quantite_pretee", "date_retour_effective")
+        .first()
+    )
+    if old is not None:
+        instance._old_stock_state = (old[0], _dette_delta(old[1], old[2]))  # type: ignore[attr-defined]
 
 
 @receiver(post_save, sender=Dette)
 def dette_post_save(sender, instance: Dette, **kwargs):  # noqa: ARG001
     if is_stock_recalc_disabled():
         return
-    recalculate_stock_for_product(instance.produit_id)
+    _apply_stock_change(
+        getattr(instance, "_old_stock_state", None),
+        (instance.produit_id, _dette_delta(instance.quantite_pretee, instance.date_retour_effective)),
+    )
 
 
 @receiver(post_delete, sender=Dette)
 def dette_post_delete(sender, instance: Dette, **kwargs):  # noqa: ARG001
     if is_stock_recalc_disabled():
         return
-    recalculate_stock_for_product(instance.produit_id)
+    _apply_stock_change(
+        (instance.produit_id, _dette_delta(instance.quantite_pretee, instance.date_retour_effective)),
+        None,
+    )
@@ -1,5 +1,5 @@
 from django.urls import include, path
-from rest_framework.routers import DefaultRouter
+from rest_framework.routers import SimpleRouter
 
 from inventory.views import (
     AuditEventViewSet,
@@ -22,7 +22,7 @@ from inventory.views import (
     TransactionViewSet,
 )
 
-router = DefaultRouter()
+router = SimpleRouter()
 router.register(r"audit", AuditEventViewSet, basename="audit")
 router.register(r"envois", EnvoiViewSet)
 router.register(r"products", ProduitViewSet)
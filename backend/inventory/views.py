@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import csv
-import io
 import posixpath
 import re
 import unicodedata
@@ -10,11 +9,27 @@ import zipfile
 from decimal import Decimal, InvalidOperation
 
 from collections import defaultdict
-from datetime import date
-from django.core.files.base import ContentFile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone as dt_timezone
+from itertools import chain, islice
+from django.core.files.base import File
 from django.db import transaction as db_transaction
-from django.http import HttpResponse
+from django.db.models import (
+    BooleanField,
+    Case,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Q,
+    Sum,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.functions import Coalesce, Concat, NullIf, RowNumber, Trim, TruncMonth
+from django.http import HttpResponse, StreamingHttpResponse
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from rest_framework import permissions, status, viewsets
@@ -22,6 +37,7 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.serializers import as_serializer_error
 from rest_framework.views import APIView
 
 from inventory.audit import log_audit_event
@@ -38,36 +54,100 @@ from inventory.serializers import (
 from inventory.services import (
     disable_stock_recalc,
     get_current_exchange_rate,
-    recalculate_stock_for_product,
+    recalculate_stock_for_products,
 )
 
 
+_Q2 = Decimal("0.01")
+_ZERO = Decimal("0")
+
+
 def _csv_cell(value) -> str:
     if value is None:
         return ""
     if isinstance(value, Decimal):
-        return str(value.quantize(Decimal("0.01"))).replace(".", ",")
+        return str(value.quantize(_Q2)).replace(".", ",")
     return str(value)
 
 
-def _apply_worksheet_formatting(ws):
-    ws.freeze_panes = "A2"
-    ws.auto_filter.ref = ws.dimensions
+def _xlsx_cell(value):
+    if isinstance(value, Decimal):
+        return float(value.quantize(_Q2))
+    return value
+
+
+_CSV_STREAM_CHUNK_ROWS = 1000
+
+
+class _Echo:
+    # Pseudo-fichier : csv.writer renvoie directement la ligne formatée.
+    def write(self, value: str) -> str:
+        return value
+
+
+def _csv_streaming_response(filename: str, header: list[str], rows) -> StreamingHttpResponse:
+    def stream():
+        writer = csv.writer(_Echo(), delimiter=";")
+        # Lignes regroupées par paquets : moins d'écritures côté serveur WSGI.
+        chunk = ["\ufeff" + writer.writerow(header)]
+        for row in rows:
+            chunk.append(writer.writerow(row))
+            if len(chunk) >= _CSV_STREAM_CHUNK_ROWS:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+    response = StreamingHttpResponse(stream(), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+_XLSX_WIDTH_SAMPLE_ROWS = 500
 
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
 
+def _xlsx_write_only_response(filename: str, title: str, header: list[str], rows) -> HttpResponse:
+    # En écriture seule, les largeurs doivent être posées avant la première ligne :
+    # on les mesure sur l'en-tête et les premières lignes, sans garder tout l'export en mémoire.
+    rows = iter(rows)
+    sample = list(islice(rows, _XLSX_WIDTH_SAMPLE_ROWS))
     widths: dict[int, int] = {}
-    for row in ws.iter_rows(values_only=True):
+    for row in (header, *sample):
         for idx, value in enumerate(row, start=1):
             if value is None:
                 continue
             widths[idx] = max(widths.get(idx, 0), len(str(value)))
 
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.freeze_panes = "A2"
     for idx, width in widths.items():
         ws.column_dimensions[get_column_letter(idx)].width = min(max(width + 2, 10), 45)
 
+    header_font = Font(bold=True)
+    header_cells = []
+    for value in header:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = header_font
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    row_count = 1
+    max_columns = len(header)
+    for row in chain(sample, rows):
+        ws.append(row)
+        row_count += 1
+        max_columns = max(max_columns, len(row))
+    # autoFilter est écrit après les lignes : la plage peut être posée une fois celles-ci comptées.
+    ws.auto_filter.ref = f"A1:{get_column_letter(max_columns)}{row_count}"
+
+    response = HttpResponse(
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    wb.save(response)
+    return response
+
 
 def _get_envoi_id_from_request(request) -> int | None:
     raw = None
@@ -94,8 +174,9 @@ def get_envoi_from_request(request, *, required: bool = True) -> Envoi | None:
             raise ValidationError({"envoi_id": "Envoi requis (envoi_id)."})
         return None
 
+    # Les vues n'utilisent que l'id (filtres, clés étrangères) et le nom de l'envoi.
     try:
-        envoi = Envoi.objects.get(pk=envoi_id)
+        envoi = Envoi.objects.only("id", "nom").get(pk=envoi_id)
     except Envoi.DoesNotExist as exc:
         raise ValidationError({"envoi_id": "Envoi introuvable."}) from exc
 
@@ -107,6 +188,58 @@ _XDR_NS = "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing"
 _A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
 _R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
 
+_REL_TAG = f"{{{_REL_NS}}}Relationship"
+_ANCHOR_TAGS = frozenset((f"{{{_XDR_NS}}}oneCellAnchor", f"{{{_XDR_NS}}}twoCellAnchor"))
+_FROM_COL_PATH = f"{{{_XDR_NS}}}from/{{{_XDR_NS}}}col"
+_FROM_ROW_PATH = f"{{{_XDR_NS}}}from/{{{_XDR_NS}}}row"
+_BLIP_PATH = f".//{{{_A_NS}}}blip"
+_R_EMBED = f"{{{_R_NS}}}embed"
+_R_LINK = f"{{{_R_NS}}}link"
+
+# Nettoyage des nombres saisis dans l'Excel (espaces, séparateur décimal).
+_DECIMAL_SEPARATORS = str.maketrans({" ": None, "\u00a0": None, ",": "."})
+_INT_SEPARATORS = str.maketrans({" ": None, "\u00a0": None})
+_DECIMAL_CHARS = frozenset("0123456789.-")
+_INT_CHARS = frozenset("0123456789-")
+_NON_DECIMAL_RE = re.compile(r"[^0-9.\-]+")
+_NON_INT_RE = re.compile(r"[^0-9\-]+")
+_HEADER_SEPARATORS_RE = re.compile(r"[^a-z0-9]+")
+_URL_SCHEME_RE = re.compile(r"^[a-z][a-z0-9+.-]*://", re.IGNORECASE)
+_SAFE_STEM_RE = re.compile(r"[^a-zA-Z0-9]+")
+
+# Signatures d'images reconnues à l'import, indexées par longueur du préfixe.
+_IMAGE_SIGNATURES: tuple[tuple[int, dict[bytes, str]], ...] = (
+    (8, {b"\x89PNG\r\n\x1a\n": "png"}),
+    (6, {b"GIF87a": "gif", b"GIF89a": "gif"}),
+    (2, {b"\xff\xd8": "jpg"}),
+)
+
+
+# Image à importer : archive, membre, extension détectée (None si format non géré).
+_ImageSource = tuple[zipfile.ZipFile, "str | zipfile.ZipInfo", "str | None"]
+
+
+def _cell_text(value: object) -> str:
+    # Les textes arrivent déjà nettoyés par cell_value ; seuls nombres et dates sont convertis.
+    return value if isinstance(value, str) else str(value).strip()
+
+
+def _is_blank_cell(cell: object) -> bool:
+    # Équivalent à cell.strip() == "" sans allouer de nouvelle chaîne.
+    return cell is None or (isinstance(cell, str) and (not cell or cell.isspace()))
+
+
+def _sniff_image_extension(data: bytes) -> str | None:
+    if not data:
+        return None
+    for size, signatures in _IMAGE_SIGNATURES:
+        ext = signatures.get(data[:size])
+        if ext:
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
 
 def _zip_join(base: str, target: str) -> str | None:
     target_raw = str(target or "")
@@ -132,103 +265,100 @@ def _zip_join(base: str, target: str) -> str | None:
     return joined
 
 
-def _extract_xlsx_images_by_row(xlsx_bytes: bytes, worksheet: object) -> dict[int, list[tuple[int, bytes]]]:
-    images_by_row: dict[int, list[tuple[int, bytes]]] = defaultdict(list)
-    if not xlsx_bytes:
-        return images_by_row
+def _rels_path(part_path: str) -> str:
+    return posixpath.join(
+        posixpath.dirname(part_path),
+        "_rels",
+        posixpath.basename(part_path) + ".rels",
+    )
+
+
+def _iter_relationships(zf: zipfile.ZipFile, rels_path: str):
+    # Lecture en flux du .rels : chaque relation est libérée après usage.
+    with zf.open(rels_path) as rels_fh:
+        for _event, rel_el in ET.iterparse(rels_fh, events=("end",)):
+            if rel_el.tag == _REL_TAG:
+                yield rel_el.attrib
+                rel_el.clear()
 
+
+def _worksheet_drawing_targets(zf: zipfile.ZipFile, worksheet_path: str) -> list[str]:
+    targets: list[str] = []
     try:
-        with zipfile.ZipFile(io.BytesIO(xlsx_bytes)) as zf:
-            names = set(zf.namelist())
-
-            drawing_targets: list[str] = []
-            for rel in getattr(worksheet, "_rels", []) or []:
-                rel_type = str(getattr(rel, "Type", "") or "")
-                target = getattr(rel, "Target", None) or getattr(rel, "target", None)
-                if not target:
-                    continue
-                target_str = str(target)
-                if rel_type.endswith("/drawing") or "drawings/" in target_str:
-                    drawing_targets.append(target_str)
-
-            ns = {"xdr": _XDR_NS, "a": _A_NS, "r": _R_NS}
-
-            for drawing_target in drawing_targets:
-                drawing_path = str(drawing_target).lstrip("/")
-                if drawing_path.startswith("../"):
-                    drawing_path = posixpath.normpath(posixpath.join("xl/worksheets", drawing_path))
-                drawing_path = drawing_path.lstrip("/")
-                if drawing_path not in names and f"xl/{drawing_path}" in names:
-                    drawing_path = f"xl/{drawing_path}"
-                if drawing_path not in names:
-                    continue
+        for attrib in _iter_relationships(zf, _rels_path(worksheet_path)):
+            rel_type = attrib.get("Type") or ""
+            target = attrib.get("Target")
+            if not target or not (rel_type.endswith("/drawing") or "drawings/" in target):
+                continue
+            joined = _zip_join(posixpath.dirname(worksheet_path), target)
+            if joined:
+                targets.append(joined)
+    except (KeyError, ET.ParseError, zipfile.BadZipFile):
+        return []
+    return targets
+
+
+def _extract_xlsx_images_by_row(
+    zf: zipfile.ZipFile, drawing_rel_targets: list[str]
+) -> dict[int, list[tuple[int, str]]]:
+    # Renvoie le chemin de chaque image dans le zip : les octets ne sont lus qu'à l'usage.
+    images_by_row: dict[int, list[tuple[int, str]]] = defaultdict(list)
+    if not drawing_rel_targets:
+        return images_by_row
 
-                try:
-                    drawing_xml = zf.read(drawing_path)
-                except KeyError:
-                    continue
-
-                rels_path = posixpath.join(
-                    posixpath.dirname(drawing_path),
-                    "_rels",
-                    posixpath.basename(drawing_path) + ".rels",
-                )
-                relmap: dict[str, str] = {}
-                if rels_path in names:
-                    try:
-                        rels_root = ET.fromstring(zf.read(rels_path))
-                    except ET.ParseError:
-                        rels_root = None
-                    if rels_root is not None:
-                        for rel_el in rels_root.findall(f"{{{_REL_NS}}}Relationship"):
-                            rid = rel_el.attrib.get("Id")
-                            rel_target = rel_el.attrib.get("Target")
-                            target_mode = rel_el.attrib.get("TargetMode")
-                            if not rid or not rel_target or target_mode == "External":
-                                continue
-                            joined = _zip_join(posixpath.dirname(drawing_path), rel_target)
-                            if joined:
-                                relmap[rid] = joined
+    # Index nom -> entrée déjà tenu par ZipFile : inutile d'en construire une copie.
+    names = zf.NameToInfo
+    try:
+        for drawing_path in drawing_rel_targets:
+            if drawing_path not in names:
+                continue
 
+            rels_path = _rels_path(drawing_path)
+            relmap: dict[str, str] = {}
+            if rels_path in names:
                 try:
-                    draw_root = ET.fromstring(drawing_xml)
+                    for attrib in _iter_relationships(zf, rels_path):
+                        rid = attrib.get("Id")
+                        rel_target = attrib.get("Target")
+                        if not rid or not rel_target or attrib.get("TargetMode") == "External":
+                            continue
+                        joined = _zip_join(posixpath.dirname(drawing_path), rel_target)
+                        if joined:
+                            relmap[rid] = joined
                 except ET.ParseError:
-                    continue
-
-                anchors: list[ET.Element] = []
-                anchors.extend(draw_root.findall("xdr:oneCellAnchor", ns))
-                anchors.extend(draw_root.findall("xdr:twoCellAnchor", ns))
-                for anchor in anchors:
-                    from_el = anchor.find("xdr:from", ns)
-                    if from_el is None:
-                        continue
-                    col_el = from_el.find("xdr:col", ns)
-                    row_el = from_el.find("xdr:row", ns)
-                    if col_el is None or row_el is None:
-                        continue
-                    try:
-                        col_num = int(col_el.text or "0") + 1
-                        row_num = int(row_el.text or "0") + 1
-                    except ValueError:
-                        continue
-
-                    blip = anchor.find(".//a:blip", ns)
-                    if blip is None:
-                        continue
-                    rid = blip.attrib.get(f"{{{_R_NS}}}embed") or blip.attrib.get(f"{{{_R_NS}}}link")
-                    if not rid:
-                        continue
+                    relmap = {}
 
-                    image_path = relmap.get(rid)
-                    if not image_path or image_path not in names:
-                        continue
+            # Parcours en flux : chaque ancre est libérée dès qu'elle est lue.
+            anchors: list[tuple[int, int, str]] = []
+            try:
+                with zf.open(drawing_path) as drawing_fh:
+                    for _event, anchor in ET.iterparse(drawing_fh, events=("end",)):
+                        if anchor.tag not in _ANCHOR_TAGS:
+                            continue
+                        # findtext : "" si l'élément est vide, None s'il est absent.
+                        col_text = anchor.findtext(_FROM_COL_PATH)
+                        row_text = anchor.findtext(_FROM_ROW_PATH)
+                        blip = anchor.find(_BLIP_PATH)
+                        anchor_rid = None
+                        if blip is not None:
+                            anchor_rid = blip.attrib.get(_R_EMBED) or blip.attrib.get(_R_LINK)
+                        anchor.clear()
+                        if col_text is None or row_text is None or not anchor_rid:
+                            continue
+                        try:
+                            col_num = int(col_text or "0") + 1
+                            row_num = int(row_text or "0") + 1
+                        except ValueError:
+                            continue
+                        anchors.append((row_num, col_num, anchor_rid))
+            except ET.ParseError:
+                continue
 
-                    try:
-                        img_bytes = zf.read(image_path)
-                    except KeyError:
-                        continue
-                    if img_bytes:
-                        images_by_row[row_num].append((col_num, img_bytes))
+            for row_num, col_num, rid in anchors:
+                image_path = relmap.get(rid)
+                image_info = names.get(image_path) if image_path else None
+                if image_info is not None and image_info.file_size > 0:
+                    images_by_row[row_num].append((col_num, image_path))
     except zipfile.BadZipFile:
         return images_by_row
 
@@ -294,17 +424,15 @@ class EnvoiViewSet(viewsets.ModelViewSet):
         )
 
     def perform_destroy(self, instance: Envoi):
-        produit_ids = list(Produit.objects.filter(envoi_id=instance.id).values_list("id", flat=True))
-        product_count = len(produit_ids)
-        tx_count = Transaction.objects.filter(produit_id__in=produit_ids).count() if produit_ids else 0
-        debt_count = Dette.objects.filter(produit_id__in=produit_ids).count() if produit_ids else 0
-
+        # Les compteurs du journal viennent directement des suppressions.
         with db_transaction.atomic():
             with disable_stock_recalc():
-                if produit_ids:
-                    Dette.objects.filter(produit_id__in=produit_ids).delete()
-                    Transaction.objects.filter(produit_id__in=produit_ids).delete()
-                    Produit.objects.filter(id__in=produit_ids).delete()
+                _, deleted = Dette.objects.filter(produit__envoi_id=instance.id).delete()
+                debt_count = deleted.get(Dette._meta.label, 0)
+                _, deleted = Transaction.objects.filter(produit__envoi_id=instance.id).delete()
+                tx_count = deleted.get(Transaction._meta.label, 0)
+                _, deleted = Produit.objects.filter(envoi_id=instance.id).delete()
+                product_count = deleted.get(Produit._meta.label, 0)
                 instance.delete()
 
         log_audit_event(
@@ -328,7 +456,11 @@ class ProduitViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         envoi = get_envoi_from_request(self.request, required=True)
-        return super().get_queryset().filter(envoi_id=envoi.id)
+        qs = super().get_queryset().filter(envoi_id=envoi.id)
+        if self.action == "list":
+            # La liste ne sérialise que l'id de l'envoi : seule la jointure stock est utile.
+            qs = qs.select_related(None).select_related("stock")
+        return qs
 
     def perform_create(self, serializer):
         envoi = get_envoi_from_request(self.request, required=True)
@@ -398,24 +530,24 @@ class ProduitViewSet(viewsets.ModelViewSet):
         )
 
     def perform_destroy(self, instance: Produit):
-        tx_count = Transaction.objects.filter(produit_id=instance.id).count()
-        debt_count = Dette.objects.filter(produit_id=instance.id).count()
         envoi = getattr(instance, "envoi", None)
-        log_audit_event(
-            self.request,
-            action=AuditEvent.Action.DELETE,
-            entity="produit",
-            obj=instance,
-            envoi=envoi,
-            message=f"Suppression produit {instance.nom}",
-            metadata={
-                "deleted_transactions": tx_count,
-                "deleted_debts": debt_count,
-            },
-        )
         with db_transaction.atomic():
-            Dette.objects.filter(produit_id=instance.id).delete()
-            Transaction.objects.filter(produit_id=instance.id).delete()
+            _, deleted = Dette.objects.filter(produit_id=instance.id).delete()
+            debt_count = deleted.get(Dette._meta.label, 0)
+            _, deleted = Transaction.objects.filter(produit_id=instance.id).delete()
+            tx_count = deleted.get(Transaction._meta.label, 0)
+            log_audit_event(
+                self.request,
+                action=AuditEvent.Action.DELETE,
+                entity="produit",
+                obj=instance,
+                envoi=envoi,
+                message=f"Suppression produit {instance.nom}",
+                metadata={
+                    "deleted_transactions": tx_count,
+                    "deleted_debts": debt_count,
+                },
+            )
             instance.delete()
 
 
@@ -425,7 +557,11 @@ class StockViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         envoi = get_envoi_from_request(self.request, required=True)
-        return super().get_queryset().filter(produit__envoi_id=envoi.id)
+        qs = super().get_queryset().filter(produit__envoi_id=envoi.id)
+        if self.action == "list":
+            # Le produit n'est sérialisé que par son id : pas besoin de le joindre.
+            qs = qs.select_related(None)
+        return qs
 
 
 class TransactionViewSet(viewsets.ModelViewSet):
@@ -439,7 +575,26 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         envoi = get_envoi_from_request(self.request, required=True)
-        return super().get_queryset().filter(produit__envoi_id=envoi.id)
+        qs = super().get_queryset().filter(produit__envoi_id=envoi.id)
+        if self.action == "list":
+            # Le produit n'est sérialisé que par son id : pas besoin de le joindre.
+            qs = qs.select_related(None)
+            # Totaux calculés en SQL, avec le taux courant lu une seule fois pour la liste.
+            taux = get_current_exchange_rate()
+            qs = qs.annotate(
+                total_euro_db=ExpressionWrapper(
+                    F("quantite") * F("prix_unitaire_euro"),
+                    output_field=DecimalField(max_digits=20, decimal_places=2),
+                ),
+                total_cfa_db=Coalesce(
+                    F("quantite") * F("prix_unitaire_cfa"),
+                    F("quantite")
+                    * F("prix_unitaire_euro")
+                    * Coalesce(NullIf("taux_change", Value(0)), Value(taux)),
+                    output_field=DecimalField(max_digits=30, decimal_places=4),
+                ),
+            )
+        return qs
 
     def perform_create(self, serializer):
         envoi = get_envoi_from_request(self.request, required=True)
@@ -529,7 +684,11 @@ class DetteViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         envoi = get_envoi_from_request(self.request, required=True)
-        return super().get_queryset().filter(produit__envoi_id=envoi.id)
+        qs = super().get_queryset().filter(produit__envoi_id=envoi.id)
+        if self.action == "list":
+            # La liste ne sérialise que des ids : aucune jointure n'est utile.
+            qs = qs.select_related(None)
+        return qs
 
     def perform_create(self, serializer):
         envoi = get_envoi_from_request(self.request, required=True)
@@ -590,7 +749,17 @@ class DetteViewSet(viewsets.ModelViewSet):
 
 
 class AuditEventViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = AuditEvent.objects.all().select_related("user", "envoi")
+    # Nom affiché calculé en SQL : pas de modèle User instancié par ligne.
+    queryset = AuditEvent.objects.all().select_related("envoi").annotate(
+        user_full_name=Trim(
+            Concat(
+                Coalesce("user__first_name", Value("")),
+                Value(" "),
+                Coalesce("user__last_name", Value("")),
+            )
+        ),
+        user_username=Coalesce("user__username", Value("")),
+    )
     serializer_class = AuditEventSerializer
     permission_classes = [permissions.IsAdminUser]
 
@@ -601,6 +770,7 @@ class AuditEventViewSet(viewsets.ReadOnlyModelViewSet):
         if envoi_id is not None:
             qs = qs.filter(envoi_id=envoi_id)
 
+        # Suivi en direct : parcours par clé (id > curseur), appuyé sur l'index (envoi, id).
         after_id = self.request.query_params.get("after_id")
         if after_id:
             try:
@@ -649,9 +819,10 @@ class ProductImportView(APIView):
             if not text:
                 return ""
             text = text.replace("€", "euro").replace("fcfa", "cfa").replace("xof", "cfa")
-            text = unicodedata.normalize("NFKD", text)
-            text = "".join(ch for ch in text if not unicodedata.combining(ch))
-            text = re.sub(r"[^a-z0-9]+", "_", text)
+            if not text.isascii():
+                text = unicodedata.normalize("NFKD", text)
+                text = "".join(ch for ch in text if not unicodedata.combining(ch))
+            text = _HEADER_SEPARATORS_RE.sub("_", text)
             text = text.strip("_")
             parts = ["euro" if part == "eur" else part for part in text.split("_") if part]
             return "_".join(parts)
@@ -664,12 +835,9 @@ class ProductImportView(APIView):
             if isinstance(value, (int, float)):
                 return Decimal(str(value))
 
-            raw = str(value).strip()
-            if raw == "":
-                return None
-
-            raw = raw.replace(" ", "").replace("\u00a0", "").replace(",", ".")
-            raw = re.sub(r"[^0-9.\-]+", "", raw)
+            raw = str(value).translate(_DECIMAL_SEPARATORS)
+            if not _DECIMAL_CHARS.issuperset(raw):
+                raw = _NON_DECIMAL_RE.sub("", raw)
             if raw in ("", ".", "-", "-."):
                 return None
             return Decimal(raw)
@@ -690,50 +858,38 @@ class ProductImportView(APIView):
                     return int(value)
                 raise ValueError
 
-            raw = str(value).strip()
-            if raw == "":
-                return None
-            raw = raw.replace(" ", "").replace("\u00a0", "")
-            raw = re.sub(r"[^0-9\\-]+", "", raw)
+            raw = str(value).translate(_INT_SEPARATORS)
+            if not _INT_CHARS.issuperset(raw):
+                raw = _NON_INT_RE.sub("", raw)
             if raw in ("", "-"):
                 return None
             return int(raw)
 
-        def sniff_image_extension(data: bytes) -> str | None:
-            if not data:
-                return None
-            if data.startswith(b"\x89PNG\r\n\x1a\n"):
-                return "png"
-            if data.startswith(b"\xff\xd8"):
-                return "jpg"
-            if data[:6] in (b"GIF87a", b"GIF89a"):
-                return "gif"
-            if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
-                return "webp"
-            return None
-
+        # Le fichier reçu (mémoire ou fichier temporaire Django) est lu tel quel,
+        # sans copie intégrale en mémoire.
         try:
-            xlsx_bytes = upload.read()
+            upload.seek(0)
         except Exception:
             return Response(
                 {"detail": "Impossible de lire le fichier Excel."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if not xlsx_bytes:
+        if not upload.size:
             return Response(
                 {"detail": "Fichier Excel vide."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
         try:
-            wb = load_workbook(io.BytesIO(xlsx_bytes), data_only=True)
+            wb = load_workbook(upload, read_only=True, data_only=True)
         except Exception:
             return Response(
                 {"detail": "Impossible de lire le fichier Excel (format invalide)."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        images_zip: zipfile.ZipFile | None = None
         try:
             ws = wb.active
             rows_iter = ws.iter_rows(values_only=True)
@@ -749,82 +905,61 @@ class ProductImportView(APIView):
             header_index = {h: i for i, h in enumerate(headers) if h}
             original_headers = ["" if cell is None else str(cell) for cell in header_row]
 
-            images_by_row = _extract_xlsx_images_by_row(xlsx_bytes, ws)
-            images_found_drawing_xml = sum(len(v) for v in images_by_row.values())
-            images_found_openpyxl = 0
-            try:
-                from openpyxl.utils.cell import (
-                    column_index_from_string,
-                    coordinate_from_string,
+            name_headers = (
+                "nom",
+                "produit",
+                "nom_produit",
+                "nom_du_produit",
+                "product",
+                "designation",
+                "article",
+                "libelle",
+            )
+            # Sans colonne de nom, chaque ligne serait rejetée : inutile de lire le reste du fichier.
+            if not any(name in header_index for name in name_headers):
+                return Response(
+                    {"detail": "Colonne du nom introuvable (ex: 'Nom', 'Produit', 'Désignation')."},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
 
-                for img in getattr(ws, "_images", []) or []:
-                    try:
-                        anchor = getattr(img, "anchor", None)
-                        row_num: int | None = None
-                        col_num: int | None = None
-
-                        if isinstance(anchor, str):
-                            col_letter, row_num = coordinate_from_string(anchor)
-                            col_num = column_index_from_string(col_letter)
-                        else:
-                            marker = getattr(anchor, "_from", None) or getattr(anchor, "from_", None)
-                            if marker is not None:
-                                row = getattr(marker, "row", None)
-                                col = getattr(marker, "col", None)
-                                if row is not None and col is not None:
-                                    row_num = int(row) + 1
-                                    col_num = int(col) + 1
-
-                        if row_num is None or col_num is None:
-                            continue
-                        data = img._data()
-                        if not data:
-                            continue
-                        images_by_row[row_num].append((col_num, data))
-                        images_found_openpyxl += 1
-                    except Exception:  # noqa: BLE001
-                        continue
-            except Exception:  # noqa: BLE001
-                images_found_openpyxl = 0
+            # En lecture seule, openpyxl garde l'archive ouverte : on la réutilise
+            # pour les dessins plutôt que de relire le zip.
+            images_by_row: dict[int, list[tuple[int, str]]] = defaultdict(list)
+            xlsx_zip = getattr(wb, "_archive", None)
+            worksheet_path = getattr(ws, "_worksheet_path", None)
+            if isinstance(xlsx_zip, zipfile.ZipFile) and worksheet_path:
+                images_by_row = _extract_xlsx_images_by_row(
+                    xlsx_zip, _worksheet_drawing_targets(xlsx_zip, worksheet_path)
+                )
+            images_found_drawing_xml = sum(len(v) for v in images_by_row.values())
+            # Les images ne sont plus exposées par openpyxl en lecture seule :
+            # seule l'extraction depuis le XML des dessins est utilisée.
+            images_found_openpyxl = 0
 
             if images_by_row:
+                # Une même image ancrée deux fois sur la même cellule n'est gardée qu'une fois.
                 for row_num, imgs in list(images_by_row.items()):
-                    seen: set[tuple[int, int, bytes, bytes]] = set()
-                    deduped: list[tuple[int, bytes]] = []
-                    for col_num, data in imgs:
-                        if not data:
-                            continue
-                        key = (col_num, len(data), data[:16], data[-16:])
-                        if key in seen:
-                            continue
-                        seen.add(key)
-                        deduped.append((col_num, data))
-                    images_by_row[row_num] = deduped
-
-            def cell_value(row, names: tuple[str, ...]) -> object | None:
-                for name in names:
-                    idx = header_index.get(name)
-                    if idx is None or idx >= len(row):
+                    if len(imgs) > 1:
+                        images_by_row[row_num] = list(dict.fromkeys(imgs))
+
+            def cell_value(row, indexes: tuple[int, ...]) -> object | None:
+                for idx in indexes:
+                    # Lignes normalement complétées jusqu'à max_column ; plus courtes si la dimension
+                    # déclarée par le fichier est fausse.
+                    try:
+                        value = row[idx]
+                    except IndexError:
                         continue
-                    value = row[idx]
                     if value is None:
                         continue
-                    if isinstance(value, str) and value.strip() == "":
-                        continue
+                    # Texte renvoyé déjà nettoyé : les appelants n'ont plus à le retester.
+                    if isinstance(value, str):
+                        value = value.strip()
+                        if not value:
+                            continue
                     return value
                 return None
 
-            name_headers = (
-                "nom",
-                "produit",
-                "nom_produit",
-                "nom_du_produit",
-                "product",
-                "designation",
-                "article",
-                "libelle",
-            )
             carac_headers = (
                 "caracteristiques",
                 "caracteristique",
@@ -876,33 +1011,35 @@ class ProductImportView(APIView):
             errors: list[dict[str, object]] = []
 
             taux = get_current_exchange_rate()
-            zip_images: dict[str, bytes] = {}
+            # Taux fixé pour tout le fichier : conversions EUR <-> CFA possibles ou non, décidé une fois.
+            can_convert = taux not in (None, 0)
+            # Index nom -> entrée du zip ; le contenu n'est lu que pour les lignes qui le citent.
+            zip_images: dict[str, zipfile.ZipInfo] = {}
             zip_total_files = 0
             zip_upload = request.FILES.get("images_zip")
             if zip_upload:
                 try:
-                    with zipfile.ZipFile(zip_upload) as zf:
-                        for info in zf.infolist():
-                            if info.is_dir():
-                                continue
-                            zip_total_files += 1
-                            if info.file_size <= 0:
-                                continue
-                            # Prend uniquement le nom de fichier (anti zip-slip)
-                            name = info.filename.replace("\\", "/").split("/")[-1]
-                            if not name:
-                                continue
-                            with zf.open(info) as fp:
-                                data = fp.read()
-                            if not data:
-                                continue
-                            zip_images[name.lower()] = data
+                    images_zip = zipfile.ZipFile(zip_upload)
+                    for info in images_zip.infolist():
+                        if info.is_dir():
+                            continue
+                        zip_total_files += 1
+                        if info.file_size <= 0:
+                            continue
+                        # Prend uniquement le nom de fichier (anti zip-slip)
+                        name = info.filename.replace("\\", "/").split("/")[-1]
+                        if not name:
+                            continue
+                        zip_images[name.lower()] = info
                 except zipfile.BadZipFile:
                     return Response(
                         {"detail": "Zip d'images invalide (champ 'images_zip')."},
                         status=status.HTTP_400_BAD_REQUEST,
                     )
 
+            # Découpage des en-têtes fait une fois pour toutes les détections de colonnes.
+            header_parts = [(key, idx, key.split("_")) for key, idx in header_index.items()]
+
             def detect_column(
                 keys: tuple[str, ...],
                 *,
@@ -917,9 +1054,7 @@ class ProductImportView(APIView):
                 if not include_any:
                     return None, None
 
-                for key, idx in header_index.items():
-                    parts = key.split("_")
-
+                for key, idx, parts in header_parts:
                     if exclude_any and any(
                         part.startswith(excluded) for excluded in exclude_any for part in parts
                     ):
@@ -956,240 +1091,408 @@ class ProductImportView(APIView):
             images_found = sum(len(v) for v in images_by_row.values())
             images_rows_preview = sorted(images_by_row.keys())[:12]
 
-            for row_number, row in enumerate(rows_iter, start=2):
-                if not row or all(
-                    (cell is None) or (isinstance(cell, str) and cell.strip() == "")
-                    for cell in row
-                ):
-                    skipped += 1
-                    continue
+            def sniff_member(archive: zipfile.ZipFile, member: str | zipfile.ZipInfo) -> str | None:
+                # L'en-tête suffit à reconnaître le format ; le contenu est lu à l'écriture.
+                try:
+                    with archive.open(member) as fp:
+                        return _sniff_image_extension(fp.read(16))
+                except zipfile.BadZipFile:
+                    return None
+
+            def load_row_image(
+                row_number: int, image_filename_hint: str | None
+            ) -> tuple[_ImageSource | None, str | None]:
+                candidates = images_by_row.get(row_number)
+                if candidates:
+                    if image_col is not None and len(candidates) > 1:
+                        # min() est stable comme sorted() : à distance égale, la première image gagne.
+                        member = min(candidates, key=lambda item, col=image_col: abs(item[0] - col))[1]
+                    else:
+                        member = candidates[0][1]
+                    # Format non géré (EMF, ...) : rejeté par image_filename, sans repli sur le zip.
+                    return (xlsx_zip, member, sniff_member(xlsx_zip, member)), None
+                if zip_images and image_filename_hint is not None:
+                    # Nom de fichier présent dans la colonne "Image" + zip fourni
+                    safe_name = image_filename_hint.replace("\\", "/").split("/")[-1]
+                    if safe_name:
+                        info = zip_images.get(safe_name.lower())
+                        if info is not None:
+                            return (images_zip, info, sniff_member(images_zip, info)), safe_name
+                        return None, safe_name
+                return None, None
 
-                nom = cell_value(row, name_headers)
-                if nom is None or str(nom).strip() == "":
-                    errors.append({"row": row_number, "field": "nom", "message": "Nom manquant."})
-                    continue
-                nom_str = str(nom).strip()
+            def image_filename(
+                produit: Produit, image: _ImageSource, image_name: str | None, row_number: int
+            ) -> str | None:
+                ext = image[2]
+                if not ext:
+                    return None
+                if image_name:
+                    safe_stem = _SAFE_STEM_RE.sub("_", image_name.rsplit(".", 1)[0]).strip("_")
+                    safe_stem = safe_stem[:80] if safe_stem else "image"
+                    return f"import_{produit.id}_{safe_stem}.{ext}"
+                return f"import_{produit.id}_{row_number}.{ext}"
+
+            def build_achat(
+                produit: Produit, data: dict[str, object], achat_quantite: int | None
+            ) -> Transaction | None:
+                if achat_quantite is None or achat_quantite <= 0:
+                    return None
+                pau_tx = (
+                    data.get("prix_achat_unitaire_euro")
+                    if "prix_achat_unitaire_euro" in data
+                    else getattr(produit, "prix_achat_unitaire_euro", None)
+                )
 
-                data: dict[str, object] = {"nom": nom_str}
+                tx_kwargs: dict[str, object] = {
+                    "produit_id": produit.id,
+                    "type_transaction": Transaction.TypeTransaction.ACHAT,
+                    "quantite": int(achat_quantite),
+                }
+                if pau_tx is not None:
+                    if not isinstance(pau_tx, Decimal):
+                        pau_tx = Decimal(str(pau_tx))
+                    pau_tx_dec = pau_tx.quantize(_Q2)
+                    tx_kwargs["prix_unitaire_euro"] = pau_tx_dec
+                    if taux is not None:
+                        tx_kwargs["taux_change"] = taux
+                        tx_kwargs["prix_unitaire_cfa"] = (pau_tx_dec * taux).quantize(_Q2)
+                return Transaction(**tx_kwargs)
+
+            # Champs du serializer construits une fois ; chaque ligne ne passe que par leurs validateurs.
+            row_serializer = ProduitSerializer()
+            row_fields = [
+                (name, field) for name, field in row_serializer.fields.items() if not field.read_only
+            ]
 
-                try:
-                    quantite_value: object | None
-                    if quantite_idx is not None and quantite_idx < len(row):
-                        quantite_value = row[quantite_idx]
-                    else:
-                        quantite_value = cell_value(row, quantite_headers)
-                    achat_quantite = parse_int(quantite_value)
-                except ValueError:
-                    errors.append(
-                        {
-                            "row": row_number,
-                            "field": "quantite",
-                            "message": "Quantité invalide.",
-                        }
-                    )
-                    continue
-                if achat_quantite is not None and achat_quantite < 0:
-                    errors.append(
-                        {
-                            "row": row_number,
-                            "field": "quantite",
-                            "message": "Quantité invalide (doit être >= 0).",
-                        }
-                    )
-                    continue
-
-                categorie = cell_value(row, category_headers)
-                if categorie is not None and str(categorie).strip() != "":
-                    data["categorie"] = str(categorie).strip()
-
-                carac = cell_value(row, carac_headers)
-                if carac is not None and str(carac).strip() != "":
-                    data["caracteristiques"] = str(carac).strip()
-
-                image_url = cell_value(row, image_url_headers)
-                if image_url is not None:
-                    image_url_str = str(image_url).strip()
-                    if image_url_str:
-                        # Colonne "Image URL": on accepte uniquement une vraie URL (http(s)://...).
-                        # Pour importer un fichier image, utilisez la colonne "Image" (image insérée ou zip).
-                        if re.match(r"^[a-z][a-z0-9+.-]*://", image_url_str, flags=re.IGNORECASE):
-                            data["image_url"] = image_url_str
-
-                image_filename_hint: str | None = None
-                image_filename_cell = cell_value(row, image_file_headers)
-                if image_filename_cell is not None:
-                    image_filename_hint = str(image_filename_cell).strip()
-                    if not image_filename_hint:
-                        image_filename_hint = None
+            def validate_row(
+                data: dict[str, object], *, creating: bool
+            ) -> tuple[dict[str, object] | None, dict[str, object] | None]:
+                validated: dict[str, object] = {}
+                row_errors: dict[str, object] = {}
+                for name, field in row_fields:
+                    if name not in data:
+                        continue
+                    try:
+                        validated[name] = field.run_validation(data[name])
+                    except ValidationError as exc:
+                        row_errors[name] = exc.detail
+                if row_errors:
+                    return None, row_errors
+                if creating:
+                    try:
+                        validated = row_serializer.validate(validated)
+                    except ValidationError as exc:
+                        return None, as_serializer_error(exc)
+                return validated, None
 
-                try:
-                    pau_euro = parse_decimal(cell_value(row, pau_euro_headers))
-                    pau_cfa = parse_decimal(cell_value(row, pau_cfa_headers))
-                    if pau_euro is None and pau_cfa is not None and taux not in (None, 0):
-                        pau_euro = (pau_cfa / taux).quantize(Decimal("0.01"))
-                    if pau_euro is not None:
-                        data["prix_achat_unitaire_euro"] = pau_euro.quantize(Decimal("0.01"))
-                except InvalidOperation:
-                    errors.append(
-                        {"row": row_number, "field": "prix_achat_unitaire_euro", "message": "PAU invalide."}
-                    )
-                    continue
+            image_field = Produit._meta.get_field("image")
 
+            def store_image(job: tuple[Produit, str, _ImageSource]) -> str | None:
+                produit, filename, (archive, member, _) = job
                 try:
-                    pvu_cfa = parse_decimal(cell_value(row, pvu_cfa_headers))
-                    if pvu_cfa is None:
-                        pvu_euro = parse_decimal(cell_value(row, pvu_euro_headers))
-                        if pvu_euro is not None:
-                            if taux is None or taux == 0:
-                                errors.append(
-                                    {
-                                        "row": row_number,
-                                        "field": "prix_vente_unitaire_cfa",
-                                        "message": "PVU (€) fourni mais taux EUR→CFA introuvable.",
-                                    }
-                                )
-                                continue
-                            pvu_cfa = (pvu_euro * taux).quantize(Decimal("0.01"))
-                    if pvu_cfa is not None:
-                        data["prix_vente_unitaire_cfa"] = pvu_cfa.quantize(Decimal("0.01"))
-                except InvalidOperation:
-                    errors.append(
-                        {"row": row_number, "field": "prix_vente_unitaire_cfa", "message": "PVU invalide."}
-                    )
-                    continue
+                    # Membre du zip transmis tel quel au stockage, lu par blocs.
+                    with archive.open(member) as fp:
+                        return image_field.storage.save(
+                            image_field.generate_filename(produit, filename),
+                            File(fp, name=filename),
+                            max_length=image_field.max_length,
+                        )
+                except zipfile.BadZipFile:
+                    # Entrée corrompue (CRC) : le produit est importé sans image.
+                    return None
+
+            def store_images(image_jobs: list[tuple[Produit, str, _ImageSource]]) -> int:
+                # Écritures de fichiers indépendantes (disque / stockage distant) : en parallèle.
+                with ThreadPoolExecutor(max_workers=min(8, len(image_jobs))) as pool:
+                    stored_names = list(pool.map(store_image, image_jobs))
+                stored = []
+                for (produit, _, _), stored_name in zip(image_jobs, stored_names):
+                    if stored_name is not None:
+                        produit.image.name = stored_name
+                        stored.append(produit)
+                Produit.objects.bulk_update(stored, ["image"], batch_size=1000)
+                return len(stored)
+
+            # Mode upsert : produits de l'envoi chargés une fois, indexés par nom (ids croissants).
+            existing_by_id: dict[int, Produit] = {}
+            existing_ids_by_nom: dict[str, list[int]] = {}
+            merge_primary_by_id: dict[int, int] = {}
+            upsert_achats: list[Transaction] = []
+            upsert_image_jobs: dict[int, tuple[Produit, str, _ImageSource]] = {}
+            if mode == "upsert":
+                for produit in Produit.objects.filter(envoi_id=envoi.id).order_by("id"):
+                    existing_by_id[produit.id] = produit
+                    existing_ids_by_nom.setdefault(produit.nom, []).append(produit.id)
+
+            # Mode append : lignes validées, insérées en lot après la boucle.
+            pending_rows: list[
+                tuple[int, Produit, dict[str, object], int | None, bytes | None, str | None]
+            ] = []
+
+            # Les en-têtes sont résolus en index de colonnes une seule fois pour tout le fichier.
+            def column_indexes(names: tuple[str, ...]) -> tuple[int, ...]:
+                return tuple(header_index[name] for name in names if name in header_index)
+
+            name_cols = column_indexes(name_headers)
+            carac_cols = column_indexes(carac_headers)
+            category_cols = column_indexes(category_headers)
+            image_url_cols = column_indexes(image_url_headers)
+            image_file_cols = column_indexes(image_file_headers)
+            pau_euro_cols = column_indexes(pau_euro_headers)
+            pau_cfa_cols = column_indexes(pau_cfa_headers)
+            pvu_cfa_cols = column_indexes(pvu_cfa_headers)
+            pvu_euro_cols = column_indexes(pvu_euro_headers)
+            quantite_cols = column_indexes(quantite_headers)
+
+            # Une seule transaction pour tout le fichier (points de sauvegarde par ligne).
+            with db_transaction.atomic():
+                for row_number, row in enumerate(rows_iter, start=2):
+                    if not row or all(_is_blank_cell(cell) for cell in row):
+                        skipped += 1
+                        continue
 
-                try:
-                    with db_transaction.atomic():
-                        produit = None
-                        merged_this_row = 0
-
-                        if mode == "append":
-                            serializer = ProduitSerializer(data=data)
-                            if not serializer.is_valid():
-                                errors.append({"row": row_number, "errors": serializer.errors})
-                                continue
-                            produit = serializer.save(envoi=envoi)
-                            created += 1
+                    nom = cell_value(row, name_cols)
+                    if nom is None:
+                        errors.append({"row": row_number, "field": "nom", "message": "Nom manquant."})
+                        continue
+                    nom_str = _cell_text(nom)
+
+                    data: dict[str, object] = {"nom": nom_str}
+
+                    try:
+                        quantite_value: object | None
+                        if quantite_idx is not None and quantite_idx < len(row):
+                            quantite_value = row[quantite_idx]
                         else:
-                            existing_qs = Produit.objects.filter(nom=nom_str, envoi_id=envoi.id).order_by("id")
-                            existing_count = existing_qs.count()
-                            if existing_count == 0:
-                                serializer = ProduitSerializer(data=data)
-                                if not serializer.is_valid():
-                                    errors.append({"row": row_number, "errors": serializer.errors})
+                            quantite_value = cell_value(row, quantite_cols)
+                        achat_quantite = parse_int(quantite_value)
+                    except ValueError:
+                        errors.append(
+                            {
+                                "row": row_number,
+                                "field": "quantite",
+                                "message": "Quantité invalide.",
+                            }
+                        )
+                        continue
+                    if achat_quantite is not None and achat_quantite < 0:
+                        errors.append(
+                            {
+                                "row": row_number,
+                                "field": "quantite",
+                                "message": "Quantité invalide (doit être >= 0).",
+                            }
+                        )
+                        continue
+
+                    categorie = cell_value(row, category_cols)
+                    if categorie is not None:
+                        data["categorie"] = _cell_text(categorie)
+
+                    carac = cell_value(row, carac_cols)
+                    if carac is not None:
+                        data["caracteristiques"] = _cell_text(carac)
+
+                    image_url = cell_value(row, image_url_cols)
+                    if image_url is not None:
+                        image_url_str = _cell_text(image_url)
+                        if image_url_str:
+                            # Colonne "Image URL": on accepte uniquement une vraie URL (http(s)://...).
+                            # Pour importer un fichier image, utilisez la colonne "Image" (image insérée ou zip).
+                            if _URL_SCHEME_RE.match(image_url_str):
+                                data["image_url"] = image_url_str
+
+                    image_filename_hint: str | None = None
+                    image_filename_cell = cell_value(row, image_file_cols)
+                    if image_filename_cell is not None:
+                        image_filename_hint = _cell_text(image_filename_cell)
+                        if not image_filename_hint:
+                            image_filename_hint = None
+
+                    try:
+                        pau_euro = parse_decimal(cell_value(row, pau_euro_cols))
+                        pau_cfa = parse_decimal(cell_value(row, pau_cfa_cols))
+                        if pau_euro is None and pau_cfa is not None and can_convert:
+                            pau_euro = pau_cfa / taux
+                        if pau_euro is not None:
+                            data["prix_achat_unitaire_euro"] = pau_euro.quantize(_Q2)
+                    except InvalidOperation:
+                        errors.append(
+                            {"row": row_number, "field": "prix_achat_unitaire_euro", "message": "PAU invalide."}
+                        )
+                        continue
+
+                    try:
+                        pvu_cfa = parse_decimal(cell_value(row, pvu_cfa_cols))
+                        if pvu_cfa is None:
+                            pvu_euro = parse_decimal(cell_value(row, pvu_euro_cols))
+                            if pvu_euro is not None:
+                                if not can_convert:
+                                    errors.append(
+                                        {
+                                            "row": row_number,
+                                            "field": "prix_vente_unitaire_cfa",
+                                            "message": "PVU (€) fourni mais taux EUR→CFA introuvable.",
+                                        }
+                                    )
+                                    continue
+                                pvu_cfa = pvu_euro * taux
+                        if pvu_cfa is not None:
+                            data["prix_vente_unitaire_cfa"] = pvu_cfa.quantize(_Q2)
+                    except InvalidOperation:
+                        errors.append(
+                            {"row": row_number, "field": "prix_vente_unitaire_cfa", "message": "PVU invalide."}
+                        )
+                        continue
+
+                    if mode == "append":
+                        # Validation ligne à ligne, écriture groupée après la boucle.
+                        validated, row_errors = validate_row(data, creating=True)
+                        if row_errors:
+                            errors.append({"row": row_number, "errors": row_errors})
+                            continue
+                        embedded_image, embedded_image_name = load_row_image(row_number, image_filename_hint)
+                        pending_rows.append(
+                            (
+                                row_number,
+                                Produit(envoi=envoi, **validated),
+                                data,
+                                achat_quantite,
+                                embedded_image,
+                                embedded_image_name,
+                            )
+                        )
+                        created += 1
+                        continue
+
+                    try:
+                        with db_transaction.atomic():
+                            produit = None
+                            merged_this_row = 0
+
+                            existing_ids = existing_ids_by_nom.get(nom_str)
+                            if not existing_ids:
+                                validated, row_errors = validate_row(data, creating=True)
+                                if row_errors:
+                                    errors.append({"row": row_number, "errors": row_errors})
                                     continue
-                                produit = serializer.save(envoi=envoi)
+                                produit = Produit.objects.create(envoi=envoi, **validated)
+                                existing_by_id[produit.id] = produit
+                                existing_ids_by_nom[nom_str] = [produit.id]
                                 created += 1
                             else:
-                                primary = existing_qs.first()
-                                if primary is None:
-                                    serializer = ProduitSerializer(data=data)
-                                    if not serializer.is_valid():
-                                        errors.append({"row": row_number, "errors": serializer.errors})
-                                        continue
-                                    produit = serializer.save(envoi=envoi)
-                                    created += 1
-                                else:
-                                    duplicate_ids = list(existing_qs.values_list("id", flat=True)[1:])
-                                    if duplicate_ids:
-                                        Transaction.objects.filter(produit_id__in=duplicate_ids).update(
-                                            produit_id=primary.id
-                                        )
-                                        Dette.objects.filter(produit_id__in=duplicate_ids).update(
-                                            produit_id=primary.id
-                                        )
-                                        Produit.objects.filter(id__in=duplicate_ids).delete()
-                                        merged_this_row = len(duplicate_ids)
-                                        merged += merged_this_row
-
-                                    serializer = ProduitSerializer(primary, data=data, partial=True)
-                                    if not serializer.is_valid():
-                                        errors.append({"row": row_number, "errors": serializer.errors})
-                                        continue
-                                    produit = serializer.save()
-                                    updated += 1
-
-                        embedded_image: bytes | None = None
-                        embedded_image_name: str | None = None
-                        if produit is not None and images_by_row:
-                            candidates = images_by_row.get(row_number) or []
-                            if candidates:
-                                if image_col is not None:
-                                    candidates = sorted(
-                                        candidates,
-                                        key=lambda item: abs(item[0] - image_col),
-                                    )
-                                embedded_image = candidates[0][1]
-                        if (
-                            embedded_image is None
-                            and produit is not None
-                            and zip_images
-                            and image_filename_hint is not None
-                        ):
-                            # Nom de fichier présent dans la colonne "Image" + zip fourni
-                            safe_name = image_filename_hint.replace("\\", "/").split("/")[-1]
-                            if safe_name:
-                                embedded_image = zip_images.get(safe_name.lower())
-                                embedded_image_name = safe_name
-
-                        if (
-                            produit is not None
-                            and embedded_image is not None
-                            and getattr(produit, "image", None) is not None
-                        ):
-                            ext = sniff_image_extension(embedded_image)
-                            if ext:
-                                if embedded_image_name:
-                                    safe_stem = re.sub(
-                                        r"[^a-zA-Z0-9]+",
-                                        "_",
-                                        embedded_image_name.rsplit(".", 1)[0],
-                                    ).strip("_")
-                                    safe_stem = safe_stem[:80] if safe_stem else "image"
-                                    filename = f"import_{produit.id}_{safe_stem}.{ext}"
-                                else:
-                                    filename = f"import_{produit.id}_{row_number}.{ext}"
-                                produit.image.save(
-                                    filename,
-                                    ContentFile(embedded_image),
-                                    save=True,
-                                )
-                                images_imported += 1
-
-                        if achat_quantite is not None and achat_quantite > 0 and produit is not None:
-                            pau_tx = (
-                                data.get("prix_achat_unitaire_euro")
-                                if "prix_achat_unitaire_euro" in data
-                                else getattr(produit, "prix_achat_unitaire_euro", None)
+                                primary = existing_by_id[existing_ids[0]]
+                                duplicate_ids = existing_ids[1:]
+                                if duplicate_ids:
+                                    # Fusion différée : appliquée en une passe après la boucle.
+                                    for duplicate_id in duplicate_ids:
+                                        merge_primary_by_id[duplicate_id] = primary.id
+                                    existing_ids_by_nom[nom_str] = [primary.id]
+                                    merged_this_row = len(duplicate_ids)
+                                    merged += merged_this_row
+
+                                validated, row_errors = validate_row(data, creating=False)
+                                if row_errors:
+                                    errors.append({"row": row_number, "errors": row_errors})
+                                    continue
+                                for name, value in validated.items():
+                                    setattr(primary, name, value)
+                                primary.save(update_fields=list(validated))
+                                produit = primary
+                                updated += 1
+
+                            filename = None
+                            embedded_image, embedded_image_name = load_row_image(
+                                row_number, image_filename_hint
                             )
+                            if embedded_image is not None:
+                                filename = image_filename(
+                                    produit, embedded_image, embedded_image_name, row_number
+                                )
 
-                            tx_kwargs: dict[str, object] = {
-                                "produit_id": produit.id,
-                                "type_transaction": Transaction.TypeTransaction.ACHAT,
-                                "quantite": int(achat_quantite),
+                            achat = build_achat(produit, data, achat_quantite)
+                            if achat is not None:
+                                upsert_achats.append(achat)
+                            if filename:
+                                # Écrite après la boucle : dernière image du produit seulement.
+                                upsert_image_jobs[produit.id] = (produit, filename, embedded_image)
+                                images_imported += 1
+                    except InvalidOperation:
+                        if merged_this_row > 0:
+                            # Ligne annulée : les doublons restent en place.
+                            for duplicate_id in duplicate_ids:
+                                merge_primary_by_id.pop(duplicate_id, None)
+                            existing_ids_by_nom[nom_str] = [primary.id, *duplicate_ids]
+                            merged -= merged_this_row
+                        errors.append(
+                            {
+                                "row": row_number,
+                                "field": "quantite",
+                                "message": "Quantité invalide.",
                             }
-                            if pau_tx is not None:
-                                pau_tx_dec = Decimal(str(pau_tx)).quantize(Decimal("0.01"))
-                                tx_kwargs["prix_unitaire_euro"] = pau_tx_dec
-                                if taux is not None:
-                                    tx_kwargs["taux_change"] = taux
-                                    tx_kwargs["prix_unitaire_cfa"] = (pau_tx_dec * taux).quantize(
-                                        Decimal("0.01")
-                                    )
-                            Transaction.objects.create(**tx_kwargs)
-                        elif merged_this_row > 0 and produit is not None:
-                            # Les reassignment via QuerySet.update n'émettent pas de signaux,
-                            # donc on force un recalcul du stock après fusion.
-                            recalculate_stock_for_product(produit.id)
-                except InvalidOperation:
-                    errors.append(
-                        {
-                            "row": row_number,
-                            "field": "quantite",
-                            "message": "Quantité invalide.",
-                        }
+                        )
+                        continue
+
+                if upsert_image_jobs:
+                    jobs = list(upsert_image_jobs.values())
+                    old_image_names = {produit.id: produit.image.name for produit, _, _ in jobs}
+                    images_imported -= len(jobs) - store_images(jobs)
+                    # bulk_update contourne produit_post_save : on supprime nous-mêmes les anciens fichiers.
+                    for produit, _, _ in jobs:
+                        old_name = old_image_names[produit.id]
+                        if old_name and old_name != produit.image.name:
+                            try:
+                                produit.image.storage.delete(old_name)
+                            except Exception:  # noqa: BLE001
+                                pass
+
+                stock_ids: set[int] = set()
+                if merge_primary_by_id:
+                    duplicate_ids = list(merge_primary_by_id)
+                    produit_target = Case(
+                        *[
+                            When(produit_id=duplicate_id, then=Value(primary_id))
+                            for duplicate_id, primary_id in merge_primary_by_id.items()
+                        ]
                     )
-                    continue
+                    Transaction.objects.filter(produit_id__in=duplicate_ids).update(produit_id=produit_target)
+                    Dette.objects.filter(produit_id__in=duplicate_ids).update(produit_id=produit_target)
+                    Produit.objects.filter(id__in=duplicate_ids).delete()
+                    stock_ids.update(merge_primary_by_id.values())
+                if upsert_achats:
+                    Transaction.objects.bulk_create(upsert_achats, batch_size=1000)
+                    stock_ids.update(achat.produit_id for achat in upsert_achats)
+                if stock_ids:
+                    # Ni QuerySet.update ni bulk_create n'émettent de signaux,
+                    # donc on force un recalcul groupé du stock.
+                    recalculate_stock_for_products(stock_ids)
+
+                if pending_rows:
+                    with db_transaction.atomic():
+                        produits = Produit.objects.bulk_create(
+                            [pending[1] for pending in pending_rows],
+                            batch_size=1000,
+                        )
+                        image_jobs: list[tuple[Produit, str, _ImageSource]] = []
+                        achats: list[Transaction] = []
+                        for row_number, produit, data, achat_quantite, embedded_image, embedded_image_name in (
+                            pending_rows
+                        ):
+                            if embedded_image is not None:
+                                filename = image_filename(
+                                    produit, embedded_image, embedded_image_name, row_number
+                                )
+                                if filename:
+                                    image_jobs.append((produit, filename, embedded_image))
+                            achat = build_achat(produit, data, achat_quantite)
+                            if achat is not None:
+                                achats.append(achat)
+                        if image_jobs:
+                            images_imported += store_images(image_jobs)
+                        # bulk_create n'émet pas de signaux : stocks créés et calculés en une passe.
+                        Transaction.objects.bulk_create(achats, batch_size=1000)
+                        recalculate_stock_for_products([produit.id for produit in produits])
 
             payload = {
                 "mode": mode,
@@ -1244,6 +1547,96 @@ class ProductImportView(APIView):
                 wb.close()
             except Exception:  # noqa: BLE001
                 pass
+            if images_zip is not None:
+                images_zip.close()
+
+
+def _last_sales_by_product(envoi: Envoi) -> dict[int, dict]:
+    """Dernière vente avec un prix renseigné, par produit de l'envoi."""
+    # Une ligne par produit via ROW_NUMBER() (SQLite comme PostgreSQL),
+    # au lieu de parcourir toutes les ventes.
+    last_sales_qs = (
+        Transaction.objects.filter(
+            type_transaction=Transaction.TypeTransaction.VENTE,
+            produit__envoi_id=envoi.id,
+        )
+        .exclude(prix_unitaire_cfa__isnull=True, prix_unitaire_euro__isnull=True)
+        .annotate(
+            rang=Window(
+                RowNumber(),
+                partition_by=F("produit_id"),
+                order_by=(F("date_transaction").desc(), F("id").desc()),
+            )
+        )
+        .filter(rang=1)
+        .values("produit_id", "prix_unitaire_cfa", "prix_unitaire_euro", "taux_change")
+    )
+    return {row["produit_id"]: row for row in last_sales_qs}
+
+
+_NO_VALUES: tuple[Decimal, Decimal | None] = (_ZERO, _ZERO)
+
+
+def _value_totals_by_product(
+    qs,
+    taux: Decimal | None,
+    *,
+    quantite: str,
+    prices: str = "",
+    unpriced_breaks_euro: bool = False,
+) -> dict[int, tuple[Decimal, Decimal | None]]:
+    """Valeurs (CFA, €) par produit de ventes ou de dettes, sommées en SQL.
+
+    Un groupe par produit, taux et prix renseignés : la conversion au taux se fait sur la somme.
+    La valeur en € vaut None si une ligne n'a pas pu être convertie.
+    Les produits absents valent _NO_VALUES.
+    """
+    prix_cfa = f"{prices}prix_unitaire_cfa"
+    prix_euro = f"{prices}prix_unitaire_euro"
+    groups = (
+        qs.filter(**{f"{quantite}__gt": 0})
+        .order_by()
+        .values(
+            "produit_id",
+            rate=F(f"{prices}taux_change"),
+            has_cfa=ExpressionWrapper(Q(**{f"{prix_cfa}__isnull": False}), output_field=BooleanField()),
+            has_euro=ExpressionWrapper(Q(**{f"{prix_euro}__isnull": False}), output_field=BooleanField()),
+        )
+        .annotate(
+            cfa_total=Sum(
+                F(quantite) * F(prix_cfa),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            ),
+            euro_total=Sum(
+                F(quantite) * F(prix_euro),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            ),
+        )
+    )
+
+    total_cfa: defaultdict[int, Decimal] = defaultdict(lambda: _ZERO)
+    total_euro: defaultdict[int, Decimal] = defaultdict(lambda: _ZERO)
+    euro_ok: defaultdict[int, bool] = defaultdict(lambda: True)
+    for group in groups:
+        pid = group["produit_id"]
+        rate = group["rate"] or taux
+
+        if group["has_cfa"]:
+            total_cfa[pid] += group["cfa_total"]
+            if rate is not None and rate != 0:
+                total_euro[pid] += group["cfa_total"] / rate
+            else:
+                euro_ok[pid] = False
+        elif group["has_euro"]:
+            total_euro[pid] += group["euro_total"]
+            if rate is not None:
+                total_cfa[pid] += group["euro_total"] * rate
+        elif unpriced_breaks_euro:
+            euro_ok[pid] = False
+    return {
+        pid: (total_cfa[pid], total_euro[pid] if euro_ok[pid] else None)
+        for pid in total_cfa.keys() | total_euro.keys() | euro_ok.keys()
+    }
 
 
 class StockReportView(APIView):
@@ -1259,114 +1652,45 @@ class StockReportView(APIView):
 
         envoi = get_envoi_from_request(request, required=True)
 
-        last_sales_by_product: dict[int, dict] = {}
-        last_sales_qs = (
+        last_sales_by_product = _last_sales_by_product(envoi)
+
+        sales_values_by_product = _value_totals_by_product(
             Transaction.objects.filter(
                 type_transaction=Transaction.TypeTransaction.VENTE,
                 produit__envoi_id=envoi.id,
-            )
-            .exclude(prix_unitaire_cfa__isnull=True, prix_unitaire_euro__isnull=True)
-            .order_by("produit_id", "-date_transaction", "-id")
-            .values("produit_id", "prix_unitaire_cfa", "prix_unitaire_euro", "taux_change")
+            ),
+            taux,
+            quantite="quantite",
+        )
+        debts_values_by_product = _value_totals_by_product(
+            Dette.objects.filter(
+                date_retour_effective__isnull=True,
+                produit__envoi_id=envoi.id,
+            ),
+            taux,
+            quantite="quantite_pretee",
+            prices="transaction_pret__",
+            unpriced_breaks_euro=True,
         )
-        for row in last_sales_qs:
-            pid = row["produit_id"]
-            if pid not in last_sales_by_product:
-                last_sales_by_product[pid] = row
-
-        sales_total_cfa_by_product = defaultdict(lambda: Decimal("0"))
-        sales_total_euro_by_product = defaultdict(lambda: Decimal("0"))
-        sales_total_euro_ok_by_product = defaultdict(lambda: True)
-
-        for tx in Transaction.objects.filter(
-            type_transaction=Transaction.TypeTransaction.VENTE,
-            produit__envoi_id=envoi.id,
-        ).values(
-            "produit_id",
-            "quantite",
-            "prix_unitaire_cfa",
-            "prix_unitaire_euro",
-            "taux_change",
-        ):
-            pid = tx["produit_id"]
-            qty = Decimal(tx["quantite"] or 0)
-            if qty <= 0:
-                continue
 
-            prix_cfa = tx["prix_unitaire_cfa"]
-            prix_euro = tx["prix_unitaire_euro"]
-            rate = tx["taux_change"] or taux
+        items = []
+        totals_qte_achetee = 0
+        totals_qte_vendue = 0
+        totals_stock_restant = 0
+        totals_qte_dettes = 0
 
-            if prix_cfa is not None:
-                sales_total_cfa_by_product[pid] += qty * prix_cfa
-                if rate is not None and rate != 0:
-                    sales_total_euro_by_product[pid] += qty * (prix_cfa / rate)
-                else:
-                    sales_total_euro_ok_by_product[pid] = False
-                continue
+        totals_valeur_achetee_euro = _ZERO
+        totals_valeur_vendue_euro = _ZERO
+        totals_valeur_stock_euro = _ZERO
+        totals_valeur_dettes_euro = _ZERO
 
-            if prix_euro is not None:
-                sales_total_euro_by_product[pid] += qty * prix_euro
-                if rate is not None:
-                    sales_total_cfa_by_product[pid] += qty * prix_euro * rate
+        totals_valeur_achetee_cfa = _ZERO if taux is not None else None
+        totals_valeur_stock_cfa = _ZERO if taux is not None else None
+        totals_valeur_vendue_cfa = _ZERO
+        totals_valeur_dettes_cfa = _ZERO
 
-        debts_total_cfa_by_product = defaultdict(lambda: Decimal("0"))
-        debts_total_euro_by_product = defaultdict(lambda: Decimal("0"))
-        debts_total_euro_ok_by_product = defaultdict(lambda: True)
-
-        for debt in Dette.objects.filter(
-            date_retour_effective__isnull=True,
-            produit__envoi_id=envoi.id,
-        ).values(
-            "produit_id",
-            "quantite_pretee",
-            "transaction_pret__prix_unitaire_cfa",
-            "transaction_pret__prix_unitaire_euro",
-            "transaction_pret__taux_change",
-        ):
-            pid = debt["produit_id"]
-            qty = Decimal(debt["quantite_pretee"] or 0)
-            if qty <= 0:
-                continue
-
-            prix_cfa = debt["transaction_pret__prix_unitaire_cfa"]
-            prix_euro = debt["transaction_pret__prix_unitaire_euro"]
-            rate = debt["transaction_pret__taux_change"] or taux
-
-            if prix_cfa is not None:
-                debts_total_cfa_by_product[pid] += qty * prix_cfa
-                if rate is not None and rate != 0:
-                    debts_total_euro_by_product[pid] += qty * (prix_cfa / rate)
-                else:
-                    debts_total_euro_ok_by_product[pid] = False
-                continue
-
-            if prix_euro is not None:
-                debts_total_euro_by_product[pid] += qty * prix_euro
-                if rate is not None:
-                    debts_total_cfa_by_product[pid] += qty * prix_euro * rate
-                continue
-
-            debts_total_euro_ok_by_product[pid] = False
-
-        items = []
-        totals_qte_achetee = 0
-        totals_qte_vendue = 0
-        totals_stock_restant = 0
-        totals_qte_dettes = 0
-
-        totals_valeur_achetee_euro = Decimal("0")
-        totals_valeur_vendue_euro = Decimal("0")
-        totals_valeur_stock_euro = Decimal("0")
-        totals_valeur_dettes_euro = Decimal("0")
-
-        totals_valeur_achetee_cfa = Decimal("0") if taux is not None else None
-        totals_valeur_stock_cfa = Decimal("0") if taux is not None else None
-        totals_valeur_vendue_cfa = Decimal("0")
-        totals_valeur_dettes_cfa = Decimal("0")
-
-        totals_valeur_vendue_euro_ok = True
-        totals_valeur_dettes_euro_ok = True
+        totals_valeur_vendue_euro_ok = True
+        totals_valeur_dettes_euro_ok = True
 
         for stock in Stock.objects.select_related("produit", "produit__envoi").filter(
             produit__envoi_id=envoi.id
@@ -1379,11 +1703,7 @@ class StockReportView(APIView):
             except Exception:  # noqa: BLE001
                 image_path = ""
 
-            pau = produit.prix_achat_unitaire_euro or Decimal("0")
-            qte_achetee = Decimal(stock.quantite_initial)
-            qte_vendue = Decimal(stock.quantite_vendue)
-            qte_restante = Decimal(stock.quantite_restante)
-            qte_pretee = Decimal(stock.quantite_pretee)
+            pau = produit.prix_achat_unitaire_euro or _ZERO
 
             pau_cfa = None if taux is None else (pau * taux)
 
@@ -1395,34 +1715,24 @@ class StockReportView(APIView):
                 elif sale["prix_unitaire_euro"] is not None:
                     rate = sale["taux_change"] or taux
                     if rate is not None:
-                        pvu_cfa = (sale["prix_unitaire_euro"] * rate).quantize(Decimal("0.01"))
+                        pvu_cfa = (sale["prix_unitaire_euro"] * rate).quantize(_Q2)
 
             if pvu_cfa is not None and taux is not None:
-                pvu_euro = (pvu_cfa / taux).quantize(Decimal("0.01"))
+                pvu_euro = (pvu_cfa / taux).quantize(_Q2)
             elif sale and sale["prix_unitaire_euro"] is not None:
                 pvu_euro = sale["prix_unitaire_euro"]
             else:
                 pvu_euro = None
 
-            valeur_achetee_euro = pau * qte_achetee
+            valeur_achetee_euro = pau * stock.quantite_initial
             valeur_achetee_cfa = None if taux is None else (valeur_achetee_euro * taux)
 
-            valeur_vendue_cfa = sales_total_cfa_by_product[produit.id]
-            valeur_vendue_euro = (
-                sales_total_euro_by_product[produit.id]
-                if sales_total_euro_ok_by_product[produit.id]
-                else None
-            )
+            valeur_vendue_cfa, valeur_vendue_euro = sales_values_by_product.get(produit.id, _NO_VALUES)
 
-            valeur_stock_euro = pau * qte_restante
+            valeur_stock_euro = pau * stock.quantite_restante
             valeur_stock_cfa = None if taux is None else (valeur_stock_euro * taux)
 
-            valeur_dettes_cfa = debts_total_cfa_by_product[produit.id]
-            valeur_dettes_euro = (
-                debts_total_euro_by_product[produit.id]
-                if debts_total_euro_ok_by_product[produit.id]
-                else None
-            )
+            valeur_dettes_cfa, valeur_dettes_euro = debts_values_by_product.get(produit.id, _NO_VALUES)
 
             totals_qte_achetee += stock.quantite_initial
             totals_qte_vendue += stock.quantite_vendue
@@ -1454,36 +1764,36 @@ class StockReportView(APIView):
                     "image": image_path,
                     "image_url": produit.image_url,
                     "caracteristiques": produit.caracteristiques,
-                    "pau_euro": str(pau.quantize(Decimal("0.01"))),
+                    "pau_euro": str(pau.quantize(_Q2)),
                     "pau_cfa": None
                     if pau_cfa is None
-                    else str(pau_cfa.quantize(Decimal("0.01"))),
+                    else str(pau_cfa.quantize(_Q2)),
                     "pvu_cfa": None
                     if pvu_cfa is None
-                    else str(Decimal(pvu_cfa).quantize(Decimal("0.01"))),
+                    else str(Decimal(pvu_cfa).quantize(_Q2)),
                     "pvu_euro": None
                     if pvu_euro is None
-                    else str(Decimal(pvu_euro).quantize(Decimal("0.01"))),
+                    else str(Decimal(pvu_euro).quantize(_Q2)),
                     "quantite_achetee": stock.quantite_initial,
-                    "valeur_achetee_euro": str(valeur_achetee_euro.quantize(Decimal("0.01"))),
+                    "valeur_achetee_euro": str(valeur_achetee_euro.quantize(_Q2)),
                     "valeur_achetee_cfa": None
                     if valeur_achetee_cfa is None
-                    else str(valeur_achetee_cfa.quantize(Decimal("0.01"))),
+                    else str(valeur_achetee_cfa.quantize(_Q2)),
                     "quantite_vendue": stock.quantite_vendue,
                     "valeur_vendue_euro": None
                     if valeur_vendue_euro is None
-                    else str(valeur_vendue_euro.quantize(Decimal("0.01"))),
-                    "valeur_vendue_cfa": str(valeur_vendue_cfa.quantize(Decimal("0.01"))),
+                    else str(valeur_vendue_euro.quantize(_Q2)),
+                    "valeur_vendue_cfa": str(valeur_vendue_cfa.quantize(_Q2)),
                     "stock_restant": stock.quantite_restante,
-                    "valeur_stock_euro": str(valeur_stock_euro.quantize(Decimal("0.01"))),
+                    "valeur_stock_euro": str(valeur_stock_euro.quantize(_Q2)),
                     "valeur_stock_cfa": None
                     if valeur_stock_cfa is None
-                    else str(valeur_stock_cfa.quantize(Decimal("0.01"))),
+                    else str(valeur_stock_cfa.quantize(_Q2)),
                     "quantite_pretee": stock.quantite_pretee,
                     "valeur_dettes_euro": None
                     if valeur_dettes_euro is None
-                    else str(valeur_dettes_euro.quantize(Decimal("0.01"))),
-                    "valeur_dettes_cfa": str(valeur_dettes_cfa.quantize(Decimal("0.01"))),
+                    else str(valeur_dettes_euro.quantize(_Q2)),
+                    "valeur_dettes_cfa": str(valeur_dettes_cfa.quantize(_Q2)),
                     "is_low_stock": stock.quantite_restante <= low_stock_threshold,
                 }
             )
@@ -1496,1072 +1806,566 @@ class StockReportView(APIView):
                 "totals": {
                     "quantite_achetee": totals_qte_achetee,
                     "valeur_achetee_euro": str(
-                        totals_valeur_achetee_euro.quantize(Decimal("0.01"))
+                        totals_valeur_achetee_euro.quantize(_Q2)
                     ),
                     "valeur_achetee_cfa": None
                     if totals_valeur_achetee_cfa is None
-                    else str(totals_valeur_achetee_cfa.quantize(Decimal("0.01"))),
+                    else str(totals_valeur_achetee_cfa.quantize(_Q2)),
                     "quantite_vendue": totals_qte_vendue,
                     "valeur_vendue_euro": None
                     if not totals_valeur_vendue_euro_ok
-                    else str(totals_valeur_vendue_euro.quantize(Decimal("0.01"))),
-                    "valeur_vendue_cfa": str(totals_valeur_vendue_cfa.quantize(Decimal("0.01"))),
+                    else str(totals_valeur_vendue_euro.quantize(_Q2)),
+                    "valeur_vendue_cfa": str(totals_valeur_vendue_cfa.quantize(_Q2)),
                     "stock_restant": totals_stock_restant,
                     "valeur_stock_euro": str(
-                        totals_valeur_stock_euro.quantize(Decimal("0.01"))
+                        totals_valeur_stock_euro.quantize(_Q2)
                     ),
                     "valeur_stock_cfa": None
                     if totals_valeur_stock_cfa is None
-                    else str(totals_valeur_stock_cfa.quantize(Decimal("0.01"))),
+                    else str(totals_valeur_stock_cfa.quantize(_Q2)),
                     "quantite_pretee": totals_qte_dettes,
                     "valeur_dettes_euro": None
                     if not totals_valeur_dettes_euro_ok
-                    else str(totals_valeur_dettes_euro.quantize(Decimal("0.01"))),
-                    "valeur_dettes_cfa": str(totals_valeur_dettes_cfa.quantize(Decimal("0.01"))),
+                    else str(totals_valeur_dettes_euro.quantize(_Q2)),
+                    "valeur_dettes_cfa": str(totals_valeur_dettes_cfa.quantize(_Q2)),
                 },
             }
         )
 
 
-class MonthlyReportView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get(self, request):
-        taux = get_current_exchange_rate()
-        year_raw = request.query_params.get("year")
-        envoi = get_envoi_from_request(request, required=True)
+def _month_key(dt) -> str:
+    # date ou datetime : l'ISO commence toujours par « AAAA-MM ».
+    return dt.isoformat()[:7]
 
-        qs = Transaction.objects.filter(
-            type_transaction__in=(
-                Transaction.TypeTransaction.ACHAT,
-                Transaction.TypeTransaction.VENTE,
-            )
-        ).filter(produit__envoi_id=envoi.id).order_by("date_transaction", "id")
-        if year_raw:
-            try:
-                year = int(year_raw)
-                qs = qs.filter(date_transaction__year=year)
-            except ValueError:
-                return Response(
-                    {"detail": "Paramètre 'year' invalide (ex: 2025)."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
 
-        def month_key(dt) -> str:
-            if isinstance(dt, date):
-                d = dt
-            else:
-                d = dt.date()
-            return f"{d.year:04d}-{d.month:02d}"
-
-        def tx_total_euro(tx: dict) -> Decimal | None:
-            prix_euro = tx.get("prix_unitaire_euro")
-            if prix_euro is not None:
-                return Decimal(tx["quantite"]) * prix_euro
+# _ZERO est immuable : il peut être partagé entre les copies.
+_MONTH_BUCKET = {
+    "month": "",
+    "achats_quantite": 0,
+    "achats_total_euro": _ZERO,
+    "achats_total_cfa": _ZERO,
+    "ventes_quantite": 0,
+    "ventes_total_euro": _ZERO,
+    "ventes_total_cfa": _ZERO,
+    "prets_quantite": 0,
+    "retours_quantite": 0,
+}
 
-            prix_cfa = tx.get("prix_unitaire_cfa")
-            if prix_cfa is None:
-                return None
-
-            rate = tx.get("taux_change") or taux
-            if rate is None or rate == 0:
-                return None
-            return Decimal(tx["quantite"]) * (prix_cfa / rate)
-
-        def tx_total_cfa(tx: dict) -> Decimal | None:
-            prix_cfa = tx.get("prix_unitaire_cfa")
-            if prix_cfa is not None:
-                return Decimal(tx["quantite"]) * prix_cfa
-
-            prix_euro = tx.get("prix_unitaire_euro")
-            if prix_euro is None:
-                return None
 
-            rate = tx.get("taux_change") or taux
-            if rate is None:
-                return None
-            return Decimal(tx["quantite"]) * prix_euro * rate
-
-        buckets = defaultdict(
-            lambda: {
-                "month": "",
-                "achats_quantite": 0,
-                "achats_total_euro": Decimal("0"),
-                "achats_total_cfa": Decimal("0"),
-                "ventes_quantite": 0,
-                "ventes_total_euro": Decimal("0"),
-                "ventes_total_cfa": Decimal("0"),
-                "prets_quantite": 0,
-                "retours_quantite": 0,
-            }
+def _monthly_report(envoi: Envoi, year: int | None, taux: Decimal | None) -> tuple[list[dict], dict]:
+    """Mois et totaux du rapport mensuel ; montants en Decimal arrondis au centime."""
+    qs = Transaction.objects.filter(
+        type_transaction__in=(
+            Transaction.TypeTransaction.ACHAT,
+            Transaction.TypeTransaction.VENTE,
         )
+    ).filter(produit__envoi_id=envoi.id)
+    if year is not None:
+        qs = qs.filter(date_transaction__year=year)
+
+    buckets: defaultdict[str, dict] = defaultdict(_MONTH_BUCKET.copy)
 
-        fields = (
-            "date_transaction",
+    # Agrégation faite en SQL : un groupe par mois, type, taux et prix renseignés.
+    # Les conversions EUR <-> CFA se font ensuite sur les sommes (le taux est constant par groupe).
+    tx_groups = (
+        qs.order_by()
+        .values(
             "type_transaction",
-            "quantite",
-            "prix_unitaire_euro",
-            "prix_unitaire_cfa",
             "taux_change",
+            month=TruncMonth("date_transaction", tzinfo=dt_timezone.utc),
+            has_euro=ExpressionWrapper(Q(prix_unitaire_euro__isnull=False), output_field=BooleanField()),
+            has_cfa=ExpressionWrapper(Q(prix_unitaire_cfa__isnull=False), output_field=BooleanField()),
         )
-        for tx in qs.values(*fields):
-            m = month_key(tx["date_transaction"])
-            bucket = buckets[m]
-            bucket["month"] = m
-
-            ttype = tx["type_transaction"]
-            qty = int(tx["quantite"])
-            total_euro = tx_total_euro(tx)
-            total_cfa = tx_total_cfa(tx)
-
-            if ttype == Transaction.TypeTransaction.ACHAT:
-                bucket["achats_quantite"] += qty
-                if total_euro is not None:
-                    bucket["achats_total_euro"] += total_euro
-                if total_cfa is not None:
-                    bucket["achats_total_cfa"] += total_cfa
-            elif ttype == Transaction.TypeTransaction.VENTE:
-                bucket["ventes_quantite"] += qty
-                if total_euro is not None:
-                    bucket["ventes_total_euro"] += total_euro
-                if total_cfa is not None:
-                    bucket["ventes_total_cfa"] += total_cfa
-        dettes_created_qs = Dette.objects.filter(produit__envoi_id=envoi.id)
-        dettes_paid_qs = Dette.objects.filter(
-            date_retour_effective__isnull=False,
-            produit__envoi_id=envoi.id,
-        )
-        if year_raw:
-            dettes_created_qs = dettes_created_qs.filter(date_pret__year=year)
-            dettes_paid_qs = dettes_paid_qs.filter(date_retour_effective__year=year)
-
-        for dette in dettes_created_qs.values("date_pret", "quantite_pretee"):
-            m = month_key(dette["date_pret"])
-            bucket = buckets[m]
-            bucket["month"] = m
-            bucket["prets_quantite"] += int(dette["quantite_pretee"])
-
-        for dette in dettes_paid_qs.values("date_retour_effective", "quantite_pretee"):
-            m = month_key(dette["date_retour_effective"])
-            bucket = buckets[m]
-            bucket["month"] = m
-            bucket["retours_quantite"] += int(dette["quantite_pretee"])
-
-        months = []
-        totals = {
-            "achats_quantite": 0,
-            "achats_total_euro": Decimal("0"),
-            "achats_total_cfa": Decimal("0"),
-            "ventes_quantite": 0,
-            "ventes_total_euro": Decimal("0"),
-            "ventes_total_cfa": Decimal("0"),
-            "prets_quantite": 0,
-            "retours_quantite": 0,
-        }
-
-        for m in sorted(buckets.keys()):
-            b = buckets[m]
-            marge_brute_cfa = b["ventes_total_cfa"] - b["achats_total_cfa"]
-            months.append(
-                {
-                    "month": b["month"],
-                    "achats_quantite": b["achats_quantite"],
-                    "achats_total_euro": str(b["achats_total_euro"].quantize(Decimal("0.01"))),
-                    "achats_total_cfa": str(b["achats_total_cfa"].quantize(Decimal("0.01"))),
-                    "ventes_quantite": b["ventes_quantite"],
-                    "ventes_total_euro": str(b["ventes_total_euro"].quantize(Decimal("0.01"))),
-                    "ventes_total_cfa": str(b["ventes_total_cfa"].quantize(Decimal("0.01"))),
-                    "marge_brute_cfa": str(marge_brute_cfa.quantize(Decimal("0.01"))),
-                    "prets_quantite": b["prets_quantite"],
-                    "retours_quantite": b["retours_quantite"],
-                }
-            )
-
-            totals["achats_quantite"] += b["achats_quantite"]
-            totals["achats_total_euro"] += b["achats_total_euro"]
-            totals["achats_total_cfa"] += b["achats_total_cfa"]
-            totals["ventes_quantite"] += b["ventes_quantite"]
-            totals["ventes_total_euro"] += b["ventes_total_euro"]
-            totals["ventes_total_cfa"] += b["ventes_total_cfa"]
-            totals["prets_quantite"] += b["prets_quantite"]
-            totals["retours_quantite"] += b["retours_quantite"]
-
-        totals_out = {
-            "achats_quantite": totals["achats_quantite"],
-            "achats_total_euro": str(totals["achats_total_euro"].quantize(Decimal("0.01"))),
-            "achats_total_cfa": str(totals["achats_total_cfa"].quantize(Decimal("0.01"))),
-            "ventes_quantite": totals["ventes_quantite"],
-            "ventes_total_euro": str(totals["ventes_total_euro"].quantize(Decimal("0.01"))),
-            "ventes_total_cfa": str(totals["ventes_total_cfa"].quantize(Decimal("0.01"))),
-            "marge_brute_cfa": str(
-                (totals["ventes_total_cfa"] - totals["achats_total_cfa"]).quantize(
-                    Decimal("0.01")
-                )
+        .annotate(
+            quantite_total=Sum("quantite"),
+            euro_total=Sum(
+                F("quantite") * F("prix_unitaire_euro"),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
             ),
-            "prets_quantite": totals["prets_quantite"],
-            "retours_quantite": totals["retours_quantite"],
-        }
-
-        return Response(
+            cfa_total=Sum(
+                F("quantite") * F("prix_unitaire_cfa"),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            ),
+        )
+    )
+    for group in tx_groups:
+        m = _month_key(group["month"])
+        bucket = buckets[m]
+        bucket["month"] = m
+
+        rate = group["taux_change"] or taux
+        total_euro = None
+        total_cfa = None
+        if group["has_euro"]:
+            total_euro = group["euro_total"]
+        elif group["has_cfa"] and rate is not None and rate != 0:
+            total_euro = group["cfa_total"] / rate
+        if group["has_cfa"]:
+            total_cfa = group["cfa_total"]
+        elif group["has_euro"] and rate is not None:
+            total_cfa = group["euro_total"] * rate
+
+        if group["type_transaction"] == Transaction.TypeTransaction.ACHAT:
+            prefix = "achats"
+        else:
+            prefix = "ventes"
+        bucket[f"{prefix}_quantite"] += int(group["quantite_total"])
+        if total_euro is not None:
+            bucket[f"{prefix}_total_euro"] += total_euro
+        if total_cfa is not None:
+            bucket[f"{prefix}_total_cfa"] += total_cfa
+
+    dettes_created_qs = Dette.objects.filter(produit__envoi_id=envoi.id)
+    dettes_paid_qs = Dette.objects.filter(
+        date_retour_effective__isnull=False,
+        produit__envoi_id=envoi.id,
+    )
+    if year is not None:
+        dettes_created_qs = dettes_created_qs.filter(date_pret__year=year)
+        dettes_paid_qs = dettes_paid_qs.filter(date_retour_effective__year=year)
+
+    for group in (
+        dettes_created_qs.order_by()
+        .values(month=TruncMonth("date_pret"))
+        .annotate(quantite_total=Sum("quantite_pretee"))
+    ):
+        m = _month_key(group["month"])
+        bucket = buckets[m]
+        bucket["month"] = m
+        bucket["prets_quantite"] += int(group["quantite_total"])
+
+    for group in (
+        dettes_paid_qs.order_by()
+        .values(month=TruncMonth("date_retour_effective"))
+        .annotate(quantite_total=Sum("quantite_pretee"))
+    ):
+        m = _month_key(group["month"])
+        bucket = buckets[m]
+        bucket["month"] = m
+        bucket["retours_quantite"] += int(group["quantite_total"])
+
+    months = []
+    totals = _MONTH_BUCKET.copy()
+
+    for m in sorted(buckets.keys()):
+        b = buckets[m]
+        marge_brute_cfa = b["ventes_total_cfa"] - b["achats_total_cfa"]
+        months.append(
             {
-                "taux_euro_cfa": None if taux is None else str(taux),
-                "months": months,
-                "totals": totals_out,
+                "month": b["month"],
+                "achats_quantite": b["achats_quantite"],
+                "achats_total_euro": b["achats_total_euro"].quantize(_Q2),
+                "achats_total_cfa": b["achats_total_cfa"].quantize(_Q2),
+                "ventes_quantite": b["ventes_quantite"],
+                "ventes_total_euro": b["ventes_total_euro"].quantize(_Q2),
+                "ventes_total_cfa": b["ventes_total_cfa"].quantize(_Q2),
+                "marge_brute_cfa": marge_brute_cfa.quantize(_Q2),
+                "prets_quantite": b["prets_quantite"],
+                "retours_quantite": b["retours_quantite"],
             }
         )
 
+        totals["achats_quantite"] += b["achats_quantite"]
+        totals["achats_total_euro"] += b["achats_total_euro"]
+        totals["achats_total_cfa"] += b["achats_total_cfa"]
+        totals["ventes_quantite"] += b["ventes_quantite"]
+        totals["ventes_total_euro"] += b["ventes_total_euro"]
+        totals["ventes_total_cfa"] += b["ventes_total_cfa"]
+        totals["prets_quantite"] += b["prets_quantite"]
+        totals["retours_quantite"] += b["retours_quantite"]
 
-class ExportTransactionsXlsxView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get(self, request):
-        envoi = get_envoi_from_request(request, required=True)
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Transactions"
-
-        ws.append(
-            [
-                "Date",
-                "Produit",
-                "Type",
-                "Quantité",
-                "Prix unitaire (€)",
-                "Prix unitaire (CFA)",
-                "Taux EUR->CFA",
-                "Total (€)",
-                "Total (CFA)",
-                "Client/Fournisseur",
-                "Notes",
-            ]
-        )
-
-        for tx in (
-            Transaction.objects.filter(
-                type_transaction__in=(
-                    Transaction.TypeTransaction.ACHAT,
-                    Transaction.TypeTransaction.VENTE,
-                )
-            )
-            .filter(produit__envoi_id=envoi.id)
-            .select_related("produit")
-            .order_by("-date_transaction", "-id")
-        ):
-            total_euro = None
-            if tx.prix_unitaire_euro is not None:
-                total_euro = (Decimal(tx.quantite) * tx.prix_unitaire_euro).quantize(
-                    Decimal("0.01")
-                )
+    totals_out = {
+        "achats_quantite": totals["achats_quantite"],
+        "achats_total_euro": totals["achats_total_euro"].quantize(_Q2),
+        "achats_total_cfa": totals["achats_total_cfa"].quantize(_Q2),
+        "ventes_quantite": totals["ventes_quantite"],
+        "ventes_total_euro": totals["ventes_total_euro"].quantize(_Q2),
+        "ventes_total_cfa": totals["ventes_total_cfa"].quantize(_Q2),
+        "marge_brute_cfa": (totals["ventes_total_cfa"] - totals["achats_total_cfa"]).quantize(_Q2),
+        "prets_quantite": totals["prets_quantite"],
+        "retours_quantite": totals["retours_quantite"],
+    }
+    return months, totals_out
 
-            total_cfa = None
-            if tx.prix_unitaire_cfa is not None:
-                total_cfa = (Decimal(tx.quantite) * tx.prix_unitaire_cfa).quantize(Decimal("0.01"))
-            elif tx.prix_unitaire_euro is not None:
-                rate = tx.taux_change or get_current_exchange_rate()
-                if rate is not None:
-                    total_cfa = (Decimal(tx.quantite) * tx.prix_unitaire_euro * rate).quantize(
-                        Decimal("0.01")
-                    )
 
-            ws.append(
-                [
-                    tx.date_transaction.isoformat(sep=" ", timespec="seconds"),
-                    tx.produit.nom,
-                    tx.type_transaction,
-                    tx.quantite,
-                    float(tx.prix_unitaire_euro) if tx.prix_unitaire_euro is not None else None,
-                    float(tx.prix_unitaire_cfa) if tx.prix_unitaire_cfa is not None else None,
-                    float(tx.taux_change) if tx.taux_change is not None else None,
-                    None if total_euro is None else float(total_euro),
-                    None if total_cfa is None else float(total_cfa),
-                    tx.client_fournisseur,
-                    tx.notes,
-                ]
-            )
+def _report_year(request) -> int | None:
+    # ValueError si le paramètre 'year' n'est pas un entier.
+    year_raw = request.query_params.get("year")
+    return int(year_raw) if year_raw else None
 
-        _apply_worksheet_formatting(ws)
 
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        response["Content-Disposition"] = 'attachment; filename="transactions.xlsx"'
-        wb.save(response)
-        return response
+def _stringify_amounts(row: dict) -> dict:
+    return {key: str(value) if isinstance(value, Decimal) else value for key, value in row.items()}
 
 
-class ExportTransactionsCsvView(APIView):
+class MonthlyReportView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        envoi = get_envoi_from_request(request, required=True)
-        out = io.StringIO(newline="")
-        writer = csv.writer(out, delimiter=";")
-        writer.writerow(
-            [
-                "Date",
-                "Produit",
-                "Type",
-                "Quantité",
-                "Prix unitaire (€)",
-                "Prix unitaire (CFA)",
-                "Taux EUR->CFA",
-                "Total (€)",
-                "Total (CFA)",
-                "Client/Fournisseur",
-                "Notes",
-            ]
-        )
-
         taux = get_current_exchange_rate()
-        for tx in (
-            Transaction.objects.filter(
-                type_transaction__in=(
-                    Transaction.TypeTransaction.ACHAT,
-                    Transaction.TypeTransaction.VENTE,
-                )
-            )
-            .filter(produit__envoi_id=envoi.id)
-            .select_related("produit")
-            .order_by("-date_transaction", "-id")
-        ):
-            total_euro = None
-            if tx.prix_unitaire_euro is not None:
-                total_euro = (Decimal(tx.quantite) * tx.prix_unitaire_euro).quantize(
-                    Decimal("0.01")
-                )
-
-            total_cfa = None
-            if tx.prix_unitaire_cfa is not None:
-                total_cfa = (Decimal(tx.quantite) * tx.prix_unitaire_cfa).quantize(Decimal("0.01"))
-            elif tx.prix_unitaire_euro is not None:
-                rate = tx.taux_change or taux
-                if rate is not None:
-                    total_cfa = (Decimal(tx.quantite) * tx.prix_unitaire_euro * rate).quantize(
-                        Decimal("0.01")
-                    )
-
-            writer.writerow(
-                [
-                    tx.date_transaction.isoformat(sep=" ", timespec="seconds"),
-                    tx.produit.nom,
-                    tx.type_transaction,
-                    tx.quantite,
-                    _csv_cell(tx.prix_unitaire_euro),
-                    _csv_cell(tx.prix_unitaire_cfa),
-                    _csv_cell(tx.taux_change),
-                    _csv_cell(total_euro),
-                    _csv_cell(total_cfa),
-                    tx.client_fournisseur,
-                    tx.notes,
-                ]
+        envoi = get_envoi_from_request(request, required=True)
+        try:
+            year = _report_year(request)
+        except ValueError:
+            return Response(
+                {"detail": "Paramètre 'year' invalide (ex: 2025)."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        response = HttpResponse(
-            out.getvalue().encode("utf-8-sig"),
-            content_type="text/csv; charset=utf-8",
-        )
-        response["Content-Disposition"] = 'attachment; filename="transactions.csv"'
-        return response
-
-
-class ExportMonthlyXlsxView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get(self, request):
-        year_raw = request.query_params.get("year")
-        report = MonthlyReportView().get(request).data
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Monthly"
-
-        ws.append(
-            [
-                "Mois",
-                "Achats (qté)",
-                "Achats (€)",
-                "Achats (CFA)",
-                "Ventes (qté)",
-                "Ventes (€)",
-                "Ventes (CFA)",
-                "Marge brute (CFA)",
-                "Dettes créées (qté)",
-                "Dettes soldées (qté)",
-            ]
+        months, totals = _monthly_report(envoi, year, taux)
+        return Response(
+            {
+                "taux_euro_cfa": None if taux is None else str(taux),
+                "months": [_stringify_amounts(row) for row in months],
+                "totals": _stringify_amounts(totals),
+            }
         )
 
-        for row in report.get("months", []):
-            ws.append(
-                [
-                    row.get("month"),
-                    row.get("achats_quantite"),
-                    float(Decimal(row.get("achats_total_euro", "0")).quantize(Decimal("0.01"))),
-                    float(Decimal(row.get("achats_total_cfa", "0")).quantize(Decimal("0.01"))),
-                    row.get("ventes_quantite"),
-                    float(Decimal(row.get("ventes_total_euro", "0")).quantize(Decimal("0.01"))),
-                    float(Decimal(row.get("ventes_total_cfa", "0")).quantize(Decimal("0.01"))),
-                    float(Decimal(row.get("marge_brute_cfa", "0")).quantize(Decimal("0.01"))),
-                    row.get("prets_quantite"),
-                    row.get("retours_quantite"),
-                ]
-            )
 
-        totals = report.get("totals") or {}
-        if totals:
-            ws.append([])
-            ws.append(
-                [
-                    "TOTAL",
-                    totals.get("achats_quantite"),
-                    float(Decimal(totals.get("achats_total_euro", "0")).quantize(Decimal("0.01"))),
-                    float(Decimal(totals.get("achats_total_cfa", "0")).quantize(Decimal("0.01"))),
-                    totals.get("ventes_quantite"),
-                    float(Decimal(totals.get("ventes_total_euro", "0")).quantize(Decimal("0.01"))),
-                    float(Decimal(totals.get("ventes_total_cfa", "0")).quantize(Decimal("0.01"))),
-                    float(Decimal(totals.get("marge_brute_cfa", "0")).quantize(Decimal("0.01"))),
-                    totals.get("prets_quantite"),
-                    totals.get("retours_quantite"),
-                ]
+_TRANSACTIONS_EXPORT_HEADER = [
+    "Date",
+    "Produit",
+    "Type",
+    "Quantité",
+    "Prix unitaire (€)",
+    "Prix unitaire (CFA)",
+    "Taux EUR->CFA",
+    "Total (€)",
+    "Total (CFA)",
+    "Client/Fournisseur",
+    "Notes",
+]
+
+
+def _export_transactions_rows(envoi: Envoi, taux: Decimal | None):
+    """Lignes d'export des achats/ventes ; montants en Decimal, mis en forme par l'appelant."""
+    qs = (
+        Transaction.objects.filter(
+            type_transaction__in=(
+                Transaction.TypeTransaction.ACHAT,
+                Transaction.TypeTransaction.VENTE,
             )
-
-        _apply_worksheet_formatting(ws)
-
-        filename = "monthly.xlsx" if not year_raw else f"monthly_{year_raw}.xlsx"
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        wb.save(response)
-        return response
+        .filter(produit__envoi_id=envoi.id)
+        .select_related("produit")
+        .order_by("-date_transaction", "-id")
+        .iterator(chunk_size=2000)
+    )
+    for tx in qs:
+        total_euro = None
+        if tx.prix_unitaire_euro is not None:
+            total_euro = (tx.prix_unitaire_euro * tx.quantite).quantize(_Q2)
+
+        total_cfa = None
+        if tx.prix_unitaire_cfa is not None:
+            total_cfa = (tx.prix_unitaire_cfa * tx.quantite).quantize(_Q2)
+        elif tx.prix_unitaire_euro is not None:
+            rate = tx.taux_change or taux
+            if rate is not None:
+                total_cfa = (tx.prix_unitaire_euro * tx.quantite * rate).quantize(_Q2)
+
+        yield [
+            tx.date_transaction.isoformat(sep=" ", timespec="seconds"),
+            tx.produit.nom,
+            tx.type_transaction,
+            tx.quantite,
+            tx.prix_unitaire_euro,
+            tx.prix_unitaire_cfa,
+            tx.taux_change,
+            total_euro,
+            total_cfa,
+            tx.client_fournisseur,
+            tx.notes,
+        ]
 
 
-class ExportMonthlyCsvView(APIView):
+class ExportTransactionsXlsxView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        year_raw = request.query_params.get("year")
-        report = MonthlyReportView().get(request).data
-
-        def dec(value):
-            if value is None:
-                return ""
-            return _csv_cell(Decimal(str(value)))
-
-        out = io.StringIO(newline="")
-        writer = csv.writer(out, delimiter=";")
-        writer.writerow(
-            [
-                "Mois",
-                "Achats (qté)",
-                "Achats (€)",
-                "Achats (CFA)",
-                "Ventes (qté)",
-                "Ventes (€)",
-                "Ventes (CFA)",
-                "Marge brute (CFA)",
-                "Dettes créées (qté)",
-                "Dettes soldées (qté)",
-            ]
+        envoi = get_envoi_from_request(request, required=True)
+        rows = (
+            [_xlsx_cell(value) for value in row]
+            for row in _export_transactions_rows(envoi, get_current_exchange_rate())
         )
-        for row in report.get("months", []):
-            writer.writerow(
-                [
-                    row.get("month"),
-                    row.get("achats_quantite"),
-                    dec(row.get("achats_total_euro")),
-                    dec(row.get("achats_total_cfa")),
-                    row.get("ventes_quantite"),
-                    dec(row.get("ventes_total_euro")),
-                    dec(row.get("ventes_total_cfa")),
-                    dec(row.get("marge_brute_cfa")),
-                    row.get("prets_quantite"),
-                    row.get("retours_quantite"),
-                ]
-            )
-
-        totals = report.get("totals") or {}
-        if totals:
-            writer.writerow([])
-            writer.writerow(
-                [
-                    "TOTAL",
-                    totals.get("achats_quantite"),
-                    dec(totals.get("achats_total_euro")),
-                    dec(totals.get("achats_total_cfa")),
-                    totals.get("ventes_quantite"),
-                    dec(totals.get("ventes_total_euro")),
-                    dec(totals.get("ventes_total_cfa")),
-                    dec(totals.get("marge_brute_cfa")),
-                    totals.get("prets_quantite"),
-                    totals.get("retours_quantite"),
-                ]
-            )
-
-        filename = "monthly.csv" if not year_raw else f"monthly_{year_raw}.csv"
-        response = HttpResponse(
-            out.getvalue().encode("utf-8-sig"),
-            content_type="text/csv; charset=utf-8",
+        return _xlsx_write_only_response(
+            "transactions.xlsx", "Transactions", _TRANSACTIONS_EXPORT_HEADER, rows
         )
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return response
 
 
-class ExportStockXlsxView(APIView):
+class ExportTransactionsCsvView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        taux = get_current_exchange_rate()
         envoi = get_envoi_from_request(request, required=True)
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Stock"
-
-        last_sales_by_product: dict[int, dict] = {}
-        last_sales_qs = (
-            Transaction.objects.filter(
-                type_transaction=Transaction.TypeTransaction.VENTE,
-                produit__envoi_id=envoi.id,
-            )
-            .exclude(prix_unitaire_cfa__isnull=True, prix_unitaire_euro__isnull=True)
-            .order_by("produit_id", "-date_transaction", "-id")
-            .values("produit_id", "prix_unitaire_cfa", "prix_unitaire_euro", "taux_change")
-        )
-        for row in last_sales_qs:
-            pid = row["produit_id"]
-            if pid not in last_sales_by_product:
-                last_sales_by_product[pid] = row
-
-        sales_total_cfa_by_product = defaultdict(lambda: Decimal("0"))
-        sales_total_euro_by_product = defaultdict(lambda: Decimal("0"))
-        sales_total_euro_ok_by_product = defaultdict(lambda: True)
-
-        for tx in Transaction.objects.filter(
-            type_transaction=Transaction.TypeTransaction.VENTE,
-            produit__envoi_id=envoi.id,
-        ).values(
-            "produit_id",
-            "quantite",
-            "prix_unitaire_cfa",
-            "prix_unitaire_euro",
-            "taux_change",
-        ):
-            pid = tx["produit_id"]
-            qty = Decimal(tx["quantite"] or 0)
-            if qty <= 0:
-                continue
-
-            prix_cfa = tx["prix_unitaire_cfa"]
-            prix_euro = tx["prix_unitaire_euro"]
-            rate = tx["taux_change"] or taux
-
-            if prix_cfa is not None:
-                sales_total_cfa_by_product[pid] += qty * prix_cfa
-                if rate is not None and rate != 0:
-                    sales_total_euro_by_product[pid] += qty * (prix_cfa / rate)
-                else:
-                    sales_total_euro_ok_by_product[pid] = False
-                continue
-
-            if prix_euro is not None:
-                sales_total_euro_by_product[pid] += qty * prix_euro
-                if rate is not None:
-                    sales_total_cfa_by_product[pid] += qty * prix_euro * rate
-
-        debts_total_cfa_by_product = defaultdict(lambda: Decimal("0"))
-        debts_total_euro_by_product = defaultdict(lambda: Decimal("0"))
-        debts_total_euro_ok_by_product = defaultdict(lambda: True)
-
-        for debt in Dette.objects.filter(
-            date_retour_effective__isnull=True,
-            produit__envoi_id=envoi.id,
-        ).values(
-            "produit_id",
-            "quantite_pretee",
-            "transaction_pret__prix_unitaire_cfa",
-            "transaction_pret__prix_unitaire_euro",
-            "transaction_pret__taux_change",
-        ):
-            pid = debt["produit_id"]
-            qty = Decimal(debt["quantite_pretee"] or 0)
-            if qty <= 0:
-                continue
-
-            prix_cfa = debt["transaction_pret__prix_unitaire_cfa"]
-            prix_euro = debt["transaction_pret__prix_unitaire_euro"]
-            rate = debt["transaction_pret__taux_change"] or taux
-
-            if prix_cfa is not None:
-                debts_total_cfa_by_product[pid] += qty * prix_cfa
-                if rate is not None and rate != 0:
-                    debts_total_euro_by_product[pid] += qty * (prix_cfa / rate)
-                else:
-                    debts_total_euro_ok_by_product[pid] = False
-                continue
-
-            if prix_euro is not None:
-                debts_total_euro_by_product[pid] += qty * prix_euro
-                if rate is not None:
-                    debts_total_cfa_by_product[pid] += qty * prix_euro * rate
-                continue
-
-            debts_total_euro_ok_by_product[pid] = False
-
-        ws.append(
-            [
-                "Produit",
-                "Caractéristiques",
-                "PAU (€)",
-                "PAU (CFA)",
-                "PVU (CFA)",
-                "PVU (€)",
-                "Quantité achetée",
-                "Valeur achetée (€)",
-                "Valeur achetée (CFA)",
-                "Quantité vendue",
-                "Valeur vendue (€)",
-                "Valeur vendue (CFA)",
-                "Stock restant",
-                "Valeur stock (€)",
-                "Valeur stock (CFA)",
-                "Dettes clients (qté en cours)",
-                "Valeur dettes (€)",
-                "Valeur dettes (CFA)",
-            ]
+        # Les lignes sont produites au fil de l'envoi de la réponse.
+        rows = (
+            [_csv_cell(value) for value in row]
+            for row in _export_transactions_rows(envoi, get_current_exchange_rate())
         )
+        return _csv_streaming_response("transactions.csv", _TRANSACTIONS_EXPORT_HEADER, rows)
+
+
+_MONTHLY_EXPORT_HEADER = [
+    "Mois",
+    "Achats (qté)",
+    "Achats (€)",
+    "Achats (CFA)",
+    "Ventes (qté)",
+    "Ventes (€)",
+    "Ventes (CFA)",
+    "Marge brute (CFA)",
+    "Dettes créées (qté)",
+    "Dettes soldées (qté)",
+]
+_MONTHLY_EXPORT_FIELDS = (
+    "achats_quantite",
+    "achats_total_euro",
+    "achats_total_cfa",
+    "ventes_quantite",
+    "ventes_total_euro",
+    "ventes_total_cfa",
+    "marge_brute_cfa",
+    "prets_quantite",
+    "retours_quantite",
+)
 
-        totals_qte_achetee = 0
-        totals_qte_vendue = 0
-        totals_stock_restant = 0
-        totals_qte_dettes = 0
-
-        totals_valeur_achetee_euro = Decimal("0")
-        totals_valeur_vendue_euro = Decimal("0")
-        totals_valeur_stock_euro = Decimal("0")
-        totals_valeur_dettes_euro = Decimal("0")
-
-        totals_valeur_achetee_cfa = Decimal("0") if taux is not None else None
-        totals_valeur_stock_cfa = Decimal("0") if taux is not None else None
-        totals_valeur_vendue_cfa = Decimal("0")
-        totals_valeur_dettes_cfa = Decimal("0")
-
-        totals_valeur_vendue_euro_ok = True
-        totals_valeur_dettes_euro_ok = True
-
-        for stock in Stock.objects.select_related("produit", "produit__envoi").filter(
-            produit__envoi_id=envoi.id
-        ):
-            produit = stock.produit
-            pau = produit.prix_achat_unitaire_euro or Decimal("0")
-            qte_achetee = Decimal(stock.quantite_initial)
-            qte_vendue = Decimal(stock.quantite_vendue)
-            qte_restante = Decimal(stock.quantite_restante)
-            qte_pretee = Decimal(stock.quantite_pretee)
-
-            pau_cfa = None if taux is None else (pau * taux)
-
-            pvu_cfa = produit.prix_vente_unitaire_cfa
-            sale = last_sales_by_product.get(produit.id)
-            if pvu_cfa is None and sale:
-                if sale["prix_unitaire_cfa"] is not None:
-                    pvu_cfa = sale["prix_unitaire_cfa"]
-                elif sale["prix_unitaire_euro"] is not None:
-                    rate = sale["taux_change"] or taux
-                    if rate is not None:
-                        pvu_cfa = (sale["prix_unitaire_euro"] * rate).quantize(
-                            Decimal("0.01")
-                        )
-
-            if pvu_cfa is not None and taux is not None:
-                pvu_euro = (pvu_cfa / taux).quantize(Decimal("0.01"))
-            elif sale and sale["prix_unitaire_euro"] is not None:
-                pvu_euro = sale["prix_unitaire_euro"]
-            else:
-                pvu_euro = None
-
-            valeur_achetee_euro = pau * qte_achetee
-            valeur_achetee_cfa = None if taux is None else (valeur_achetee_euro * taux)
-
-            valeur_vendue_cfa = sales_total_cfa_by_product[produit.id]
-            valeur_vendue_euro = (
-                sales_total_euro_by_product[produit.id]
-                if sales_total_euro_ok_by_product[produit.id]
-                else None
-            )
-
-            valeur_stock_euro = pau * qte_restante
-            valeur_stock_cfa = None if taux is None else (valeur_stock_euro * taux)
-
-            valeur_dettes_cfa = debts_total_cfa_by_product[produit.id]
-            valeur_dettes_euro = (
-                debts_total_euro_by_product[produit.id]
-                if debts_total_euro_ok_by_product[produit.id]
-                else None
-            )
 
-            totals_qte_achetee += stock.quantite_initial
-            totals_qte_vendue += stock.quantite_vendue
-            totals_stock_restant += stock.quantite_restante
-            totals_qte_dettes += stock.quantite_pretee
-
-            totals_valeur_achetee_euro += valeur_achetee_euro
-            totals_valeur_stock_euro += valeur_stock_euro
-            if valeur_vendue_euro is not None:
-                totals_valeur_vendue_euro += valeur_vendue_euro
-            elif stock.quantite_vendue:
-                totals_valeur_vendue_euro_ok = False
-            if valeur_dettes_euro is not None:
-                totals_valeur_dettes_euro += valeur_dettes_euro
-            elif stock.quantite_pretee:
-                totals_valeur_dettes_euro_ok = False
+def _monthly_export_rows(months: list[dict], totals: dict):
+    for row in months:
+        yield [row["month"], *(row[field] for field in _MONTHLY_EXPORT_FIELDS)]
+    if totals:
+        yield []
+        yield ["TOTAL", *(totals[field] for field in _MONTHLY_EXPORT_FIELDS)]
 
-            if totals_valeur_achetee_cfa is not None and valeur_achetee_cfa is not None:
-                totals_valeur_achetee_cfa += valeur_achetee_cfa
-            if totals_valeur_stock_cfa is not None and valeur_stock_cfa is not None:
-                totals_valeur_stock_cfa += valeur_stock_cfa
-            totals_valeur_vendue_cfa += valeur_vendue_cfa
-            totals_valeur_dettes_cfa += valeur_dettes_cfa
 
-            ws.append(
-                [
-                    produit.nom,
-                    produit.caracteristiques,
-                    float(pau),
-                    None
-                    if pau_cfa is None
-                    else float(pau_cfa.quantize(Decimal("0.01"))),
-                    None
-                    if pvu_cfa is None
-                    else float(Decimal(pvu_cfa).quantize(Decimal("0.01"))),
-                    None
-                    if pvu_euro is None
-                    else float(Decimal(pvu_euro).quantize(Decimal("0.01"))),
-                    stock.quantite_initial,
-                    float(valeur_achetee_euro.quantize(Decimal("0.01"))),
-                    None
-                    if valeur_achetee_cfa is None
-                    else float(valeur_achetee_cfa.quantize(Decimal("0.01"))),
-                    stock.quantite_vendue,
-                    None
-                    if valeur_vendue_euro is None
-                    else float(valeur_vendue_euro.quantize(Decimal("0.01"))),
-                    float(valeur_vendue_cfa.quantize(Decimal("0.01"))),
-                    stock.quantite_restante,
-                    float(valeur_stock_euro.quantize(Decimal("0.01"))),
-                    None
-                    if valeur_stock_cfa is None
-                    else float(valeur_stock_cfa.quantize(Decimal("0.01"))),
-                    stock.quantite_pretee,
-                    None
-                    if valeur_dettes_euro is None
-                    else float(valeur_dettes_euro.quantize(Decimal("0.01"))),
-                    float(valeur_dettes_cfa.quantize(Decimal("0.01"))),
-                ]
-            )
+class ExportMonthlyXlsxView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-        ws.append([])
-        ws.append(
-            [
-                "TOTAL",
-                "",
-                None,
-                None,
-                None,
-                None,
-                totals_qte_achetee,
-                float(totals_valeur_achetee_euro.quantize(Decimal("0.01"))),
-                None
-                if totals_valeur_achetee_cfa is None
-                else float(totals_valeur_achetee_cfa.quantize(Decimal("0.01"))),
-                totals_qte_vendue,
-                None
-                if not totals_valeur_vendue_euro_ok
-                else float(totals_valeur_vendue_euro.quantize(Decimal("0.01"))),
-                float(totals_valeur_vendue_cfa.quantize(Decimal("0.01"))),
-                totals_stock_restant,
-                float(totals_valeur_stock_euro.quantize(Decimal("0.01"))),
-                None
-                if totals_valeur_stock_cfa is None
-                else float(totals_valeur_stock_cfa.quantize(Decimal("0.01"))),
-                totals_qte_dettes,
-                None
-                if not totals_valeur_dettes_euro_ok
-                else float(totals_valeur_dettes_euro.quantize(Decimal("0.01"))),
-                float(totals_valeur_dettes_cfa.quantize(Decimal("0.01"))),
-            ]
-        )
+    def get(self, request):
+        year_raw = request.query_params.get("year")
+        envoi = get_envoi_from_request(request, required=True)
+        try:
+            months, totals = _monthly_report(envoi, _report_year(request), get_current_exchange_rate())
+        except ValueError:
+            # Année invalide : export limité à l'en-tête.
+            months, totals = [], {}
 
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        response["Content-Disposition"] = 'attachment; filename="stock.xlsx"'
-        _apply_worksheet_formatting(ws)
-        wb.save(response)
-        return response
+        rows = ([_xlsx_cell(value) for value in row] for row in _monthly_export_rows(months, totals))
+        filename = "monthly.xlsx" if not year_raw else f"monthly_{year_raw}.xlsx"
+        return _xlsx_write_only_response(filename, "Monthly", _MONTHLY_EXPORT_HEADER, rows)
 
 
-class ExportStockCsvView(APIView):
+class ExportMonthlyCsvView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        taux = get_current_exchange_rate()
+        year_raw = request.query_params.get("year")
         envoi = get_envoi_from_request(request, required=True)
+        try:
+            months, totals = _monthly_report(envoi, _report_year(request), get_current_exchange_rate())
+        except ValueError:
+            # Année invalide : export limité à l'en-tête.
+            months, totals = [], {}
 
-        last_sales_by_product: dict[int, dict] = {}
-        last_sales_qs = (
-            Transaction.objects.filter(
-                type_transaction=Transaction.TypeTransaction.VENTE,
-                produit__envoi_id=envoi.id,
-            )
-            .exclude(prix_unitaire_cfa__isnull=True, prix_unitaire_euro__isnull=True)
-            .order_by("produit_id", "-date_transaction", "-id")
-            .values("produit_id", "prix_unitaire_cfa", "prix_unitaire_euro", "taux_change")
-        )
-        for row in last_sales_qs:
-            pid = row["produit_id"]
-            if pid not in last_sales_by_product:
-                last_sales_by_product[pid] = row
-
-        sales_total_cfa_by_product = defaultdict(lambda: Decimal("0"))
-        sales_total_euro_by_product = defaultdict(lambda: Decimal("0"))
-        sales_total_euro_ok_by_product = defaultdict(lambda: True)
-
-        for tx in Transaction.objects.filter(
+        rows = ([_csv_cell(value) for value in row] for row in _monthly_export_rows(months, totals))
+        filename = "monthly.csv" if not year_raw else f"monthly_{year_raw}.csv"
+        return _csv_streaming_response(filename, _MONTHLY_EXPORT_HEADER, rows)
+
+
+_STOCK_EXPORT_HEADER = [
+    "Produit",
+    "Caractéristiques",
+    "PAU (€)",
+    "PAU (CFA)",
+    "PVU (CFA)",
+    "PVU (€)",
+    "Quantité achetée",
+    "Valeur achetée (€)",
+    "Valeur achetée (CFA)",
+    "Quantité vendue",
+    "Valeur vendue (€)",
+    "Valeur vendue (CFA)",
+    "Stock restant",
+    "Valeur stock (€)",
+    "Valeur stock (CFA)",
+    "Dettes clients (qté en cours)",
+    "Valeur dettes (€)",
+    "Valeur dettes (CFA)",
+]
+
+
+def _stock_export_rows(envoi: Envoi, taux: Decimal | None):
+    """Lignes d'export du stock puis ligne TOTAL ; montants en Decimal, mis en forme par l'appelant."""
+    last_sales_by_product = _last_sales_by_product(envoi)
+
+    sales_values_by_product = _value_totals_by_product(
+        Transaction.objects.filter(
             type_transaction=Transaction.TypeTransaction.VENTE,
             produit__envoi_id=envoi.id,
-        ).values(
-            "produit_id",
-            "quantite",
-            "prix_unitaire_cfa",
-            "prix_unitaire_euro",
-            "taux_change",
-        ):
-            pid = tx["produit_id"]
-            qty = Decimal(tx["quantite"] or 0)
-            if qty <= 0:
-                continue
+        ),
+        taux,
+        quantite="quantite",
+    )
+    debts_values_by_product = _value_totals_by_product(
+        Dette.objects.filter(
+            date_retour_effective__isnull=True,
+            produit__envoi_id=envoi.id,
+        ),
+        taux,
+        quantite="quantite_pretee",
+        prices="transaction_pret__",
+        unpriced_breaks_euro=True,
+    )
 
-            prix_cfa = tx["prix_unitaire_cfa"]
-            prix_euro = tx["prix_unitaire_euro"]
-            rate = tx["taux_change"] or taux
+    totals_qte_achetee = 0
+    totals_qte_vendue = 0
+    totals_stock_restant = 0
+    totals_qte_dettes = 0
 
-            if prix_cfa is not None:
-                sales_total_cfa_by_product[pid] += qty * prix_cfa
-                if rate is not None and rate != 0:
-                    sales_total_euro_by_product[pid] += qty * (prix_cfa / rate)
-                else:
-                    sales_total_euro_ok_by_product[pid] = False
-                continue
+    totals_valeur_achetee_euro = _ZERO
+    totals_valeur_vendue_euro = _ZERO
+    totals_valeur_stock_euro = _ZERO
+    totals_valeur_dettes_euro = _ZERO
 
-            if prix_euro is not None:
-                sales_total_euro_by_product[pid] += qty * prix_euro
-                if rate is not None:
-                    sales_total_cfa_by_product[pid] += qty * prix_euro * rate
+    totals_valeur_achetee_cfa = _ZERO if taux is not None else None
+    totals_valeur_stock_cfa = _ZERO if taux is not None else None
+    totals_valeur_vendue_cfa = _ZERO
+    totals_valeur_dettes_cfa = _ZERO
 
-        debts_total_cfa_by_product = defaultdict(lambda: Decimal("0"))
-        debts_total_euro_by_product = defaultdict(lambda: Decimal("0"))
-        debts_total_euro_ok_by_product = defaultdict(lambda: True)
+    totals_valeur_vendue_euro_ok = True
+    totals_valeur_dettes_euro_ok = True
 
-        for debt in Dette.objects.filter(
-            date_retour_effective__isnull=True,
-            produit__envoi_id=envoi.id,
-        ).values(
+    for stock in (
+        Stock.objects.filter(produit__envoi_id=envoi.id)
+        .values(
             "produit_id",
+            "quantite_initial",
+            "quantite_vendue",
+            "quantite_restante",
             "quantite_pretee",
-            "transaction_pret__prix_unitaire_cfa",
-            "transaction_pret__prix_unitaire_euro",
-            "transaction_pret__taux_change",
-        ):
-            pid = debt["produit_id"]
-            qty = Decimal(debt["quantite_pretee"] or 0)
-            if qty <= 0:
-                continue
-
-            prix_cfa = debt["transaction_pret__prix_unitaire_cfa"]
-            prix_euro = debt["transaction_pret__prix_unitaire_euro"]
-            rate = debt["transaction_pret__taux_change"] or taux
-
-            if prix_cfa is not None:
-                debts_total_cfa_by_product[pid] += qty * prix_cfa
-                if rate is not None and rate != 0:
-                    debts_total_euro_by_product[pid] += qty * (prix_cfa / rate)
-                else:
-                    debts_total_euro_ok_by_product[pid] = False
-                continue
-
-            if prix_euro is not None:
-                debts_total_euro_by_product[pid] += qty * prix_euro
-                if rate is not None:
-                    debts_total_cfa_by_product[pid] += qty * prix_euro * rate
-                continue
-
-            debts_total_euro_ok_by_product[pid] = False
-
-        out = io.StringIO(newline="")
-        writer = csv.writer(out, delimiter=";")
-        writer.writerow(
-            [
-                "Produit",
-                "Caractéristiques",
-                "PAU (€)",
-                "PAU (CFA)",
-                "PVU (CFA)",
-                "PVU (€)",
-                "Quantité achetée",
-                "Valeur achetée (€)",
-                "Valeur achetée (CFA)",
-                "Quantité vendue",
-                "Valeur vendue (€)",
-                "Valeur vendue (CFA)",
-                "Stock restant",
-                "Valeur stock (€)",
-                "Valeur stock (CFA)",
-                "Dettes clients (qté en cours)",
-                "Valeur dettes (€)",
-                "Valeur dettes (CFA)",
-            ]
+            nom=F("produit__nom"),
+            caracteristiques=F("produit__caracteristiques"),
+            prix_achat_unitaire_euro=F("produit__prix_achat_unitaire_euro"),
+            prix_vente_unitaire_cfa=F("produit__prix_vente_unitaire_cfa"),
         )
+        .iterator(chunk_size=2000)
+    ):
+        produit_id = stock["produit_id"]
+        pau = stock["prix_achat_unitaire_euro"] or _ZERO
+
+        pau_cfa = None if taux is None else (pau * taux)
+
+        pvu_cfa = stock["prix_vente_unitaire_cfa"]
+        sale = last_sales_by_product.get(produit_id)
+        if pvu_cfa is None and sale:
+            if sale["prix_unitaire_cfa"] is not None:
+                pvu_cfa = sale["prix_unitaire_cfa"]
+            elif sale["prix_unitaire_euro"] is not None:
+                rate = sale["taux_change"] or taux
+                if rate is not None:
+                    pvu_cfa = (sale["prix_unitaire_euro"] * rate).quantize(_Q2)
+
+        if pvu_cfa is not None and taux is not None:
+            pvu_euro = (pvu_cfa / taux).quantize(_Q2)
+        elif sale and sale["prix_unitaire_euro"] is not None:
+            pvu_euro = sale["prix_unitaire_euro"]
+        else:
+            pvu_euro = None
+
+        valeur_achetee_euro = pau * stock["quantite_initial"]
+        valeur_achetee_cfa = None if taux is None else (valeur_achetee_euro * taux)
+
+        valeur_vendue_cfa, valeur_vendue_euro = sales_values_by_product.get(produit_id, _NO_VALUES)
+
+        valeur_stock_euro = pau * stock["quantite_restante"]
+        valeur_stock_cfa = None if taux is None else (valeur_stock_euro * taux)
+
+        valeur_dettes_cfa, valeur_dettes_euro = debts_values_by_product.get(produit_id, _NO_VALUES)
+
+        totals_qte_achetee += stock["quantite_initial"]
+        totals_qte_vendue += stock["quantite_vendue"]
+        totals_stock_restant += stock["quantite_restante"]
+        totals_qte_dettes += stock["quantite_pretee"]
+
+        totals_valeur_achetee_euro += valeur_achetee_euro
+        totals_valeur_stock_euro += valeur_stock_euro
+        if valeur_vendue_euro is not None:
+            totals_valeur_vendue_euro += valeur_vendue_euro
+        elif stock["quantite_vendue"]:
+            totals_valeur_vendue_euro_ok = False
+        if valeur_dettes_euro is not None:
+            totals_valeur_dettes_euro += valeur_dettes_euro
+        elif stock["quantite_pretee"]:
+            totals_valeur_dettes_euro_ok = False
+
+        if totals_valeur_achetee_cfa is not None and valeur_achetee_cfa is not None:
+            totals_valeur_achetee_cfa += valeur_achetee_cfa
+        if totals_valeur_stock_cfa is not None and valeur_stock_cfa is not None:
+            totals_valeur_stock_cfa += valeur_stock_cfa
+
+        totals_valeur_vendue_cfa += valeur_vendue_cfa
+        totals_valeur_dettes_cfa += valeur_dettes_cfa
+
+        yield [
+            stock["nom"],
+            stock["caracteristiques"],
+            pau,
+            pau_cfa,
+            pvu_cfa,
+            pvu_euro,
+            stock["quantite_initial"],
+            valeur_achetee_euro,
+            valeur_achetee_cfa,
+            stock["quantite_vendue"],
+            valeur_vendue_euro,
+            valeur_vendue_cfa,
+            stock["quantite_restante"],
+            valeur_stock_euro,
+            valeur_stock_cfa,
+            stock["quantite_pretee"],
+            valeur_dettes_euro,
+            valeur_dettes_cfa,
+        ]
+
+    yield []
+    yield [
+        "TOTAL",
+        "",
+        None,
+        None,
+        None,
+        None,
+        totals_qte_achetee,
+        totals_valeur_achetee_euro,
+        totals_valeur_achetee_cfa,
+        totals_qte_vendue,
+        None if not totals_valeur_vendue_euro_ok else totals_valeur_vendue_euro,
+        totals_valeur_vendue_cfa,
+        totals_stock_restant,
+        totals_valeur_stock_euro,
+        totals_valeur_stock_cfa,
+        totals_qte_dettes,
+        None if not totals_valeur_dettes_euro_ok else totals_valeur_dettes_euro,
+        totals_valeur_dettes_cfa,
+    ]
 
-        totals_qte_achetee = 0
-        totals_qte_vendue = 0
-        totals_stock_restant = 0
-        totals_qte_dettes = 0
-
-        totals_valeur_achetee_euro = Decimal("0")
-        totals_valeur_vendue_euro = Decimal("0")
-        totals_valeur_stock_euro = Decimal("0")
-        totals_valeur_dettes_euro = Decimal("0")
-
-        totals_valeur_achetee_cfa = Decimal("0") if taux is not None else None
-        totals_valeur_stock_cfa = Decimal("0") if taux is not None else None
-        totals_valeur_vendue_cfa = Decimal("0")
-        totals_valeur_dettes_cfa = Decimal("0")
-
-        totals_valeur_vendue_euro_ok = True
-        totals_valeur_dettes_euro_ok = True
-
-        for stock in Stock.objects.select_related("produit", "produit__envoi").filter(
-            produit__envoi_id=envoi.id
-        ):
-            produit = stock.produit
-            pau = produit.prix_achat_unitaire_euro or Decimal("0")
-            qte_achetee = Decimal(stock.quantite_initial)
-            qte_vendue = Decimal(stock.quantite_vendue)
-            qte_restante = Decimal(stock.quantite_restante)
-            qte_pretee = Decimal(stock.quantite_pretee)
-
-            pau_cfa = None if taux is None else (pau * taux)
-
-            pvu_cfa = produit.prix_vente_unitaire_cfa
-            sale = last_sales_by_product.get(produit.id)
-            if pvu_cfa is None and sale:
-                if sale["prix_unitaire_cfa"] is not None:
-                    pvu_cfa = sale["prix_unitaire_cfa"]
-                elif sale["prix_unitaire_euro"] is not None:
-                    rate = sale["taux_change"] or taux
-                    if rate is not None:
-                        pvu_cfa = (sale["prix_unitaire_euro"] * rate).quantize(Decimal("0.01"))
-
-            if pvu_cfa is not None and taux is not None:
-                pvu_euro = (pvu_cfa / taux).quantize(Decimal("0.01"))
-            elif sale and sale["prix_unitaire_euro"] is not None:
-                pvu_euro = sale["prix_unitaire_euro"]
-            else:
-                pvu_euro = None
-
-            valeur_achetee_euro = pau * qte_achetee
-            valeur_achetee_cfa = None if taux is None else (valeur_achetee_euro * taux)
-
-            valeur_vendue_cfa = sales_total_cfa_by_product[produit.id]
-            valeur_vendue_euro = (
-                sales_total_euro_by_product[produit.id]
-                if sales_total_euro_ok_by_product[produit.id]
-                else None
-            )
-
-            valeur_stock_euro = pau * qte_restante
-            valeur_stock_cfa = None if taux is None else (valeur_stock_euro * taux)
-
-            valeur_dettes_cfa = debts_total_cfa_by_product[produit.id]
-            valeur_dettes_euro = (
-                debts_total_euro_by_product[produit.id]
-                if debts_total_euro_ok_by_product[produit.id]
-                else None
-            )
-
-            totals_qte_achetee += stock.quantite_initial
-            totals_qte_vendue += stock.quantite_vendue
-            totals_stock_restant += stock.quantite_restante
-            totals_qte_dettes += stock.quantite_pretee
-
-            totals_valeur_achetee_euro += valeur_achetee_euro
-            totals_valeur_stock_euro += valeur_stock_euro
-            if valeur_vendue_euro is not None:
-                totals_valeur_vendue_euro += valeur_vendue_euro
-            elif stock.quantite_vendue:
-                totals_valeur_vendue_euro_ok = False
-            if valeur_dettes_euro is not None:
-                totals_valeur_dettes_euro += valeur_dettes_euro
-            elif stock.quantite_pretee:
-                totals_valeur_dettes_euro_ok = False
 
-            if totals_valeur_achetee_cfa is not None and valeur_achetee_cfa is not None:
-                totals_valeur_achetee_cfa += valeur_achetee_cfa
-            if totals_valeur_stock_cfa is not None and valeur_stock_cfa is not None:
-                totals_valeur_stock_cfa += valeur_stock_cfa
+class ExportStockXlsxView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-            totals_valeur_vendue_cfa += valeur_vendue_cfa
-            totals_valeur_dettes_cfa += valeur_dettes_cfa
+    def get(self, request):
+        taux = get_current_exchange_rate()
+        envoi = get_envoi_from_request(request, required=True)
+        rows = ([_xlsx_cell(value) for value in row] for row in _stock_export_rows(envoi, taux))
+        return _xlsx_write_only_response("stock.xlsx", "Stock", _STOCK_EXPORT_HEADER, rows)
 
-            writer.writerow(
-                [
-                    produit.nom,
-                    produit.caracteristiques,
-                    _csv_cell(pau),
-                    _csv_cell(pau_cfa),
-                    _csv_cell(pvu_cfa),
-                    _csv_cell(pvu_euro),
-                    stock.quantite_initial,
-                    _csv_cell(valeur_achetee_euro),
-                    _csv_cell(valeur_achetee_cfa),
-                    stock.quantite_vendue,
-                    _csv_cell(valeur_vendue_euro),
-                    _csv_cell(valeur_vendue_cfa),
-                    stock.quantite_restante,
-                    _csv_cell(valeur_stock_euro),
-                    _csv_cell(valeur_stock_cfa),
-                    stock.quantite_pretee,
-                    _csv_cell(valeur_dettes_euro),
-                    _csv_cell(valeur_dettes_cfa),
-                ]
-            )
 
-        writer.writerow([])
-        writer.writerow(
-            [
-                "TOTAL",
-                "",
-                "",
-                "",
-                "",
-                "",
-                totals_qte_achetee,
-                _csv_cell(totals_valeur_achetee_euro),
-                _csv_cell(totals_valeur_achetee_cfa),
-                totals_qte_vendue,
-                "" if not totals_valeur_vendue_euro_ok else _csv_cell(totals_valeur_vendue_euro),
-                _csv_cell(totals_valeur_vendue_cfa),
-                totals_stock_restant,
-                _csv_cell(totals_valeur_stock_euro),
-                _csv_cell(totals_valeur_stock_cfa),
-                totals_qte_dettes,
-                "" if not totals_valeur_dettes_euro_ok else _csv_cell(totals_valeur_dettes_euro),
-                _csv_cell(totals_valeur_dettes_cfa),
-            ]
-        )
+class ExportStockCsvView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-        response = HttpResponse(
-            out.getvalue().encode("utf-8-sig"),
-            content_type="text/csv; charset=utf-8",
-        )
-        response["Content-Disposition"] = 'attachment; filename="stock.csv"'
-        return response
+    def get(self, request):
+        taux = get_current_exchange_rate()
+        envoi = get_envoi_from_request(request, required=True)
+        rows = ([_csv_cell(value) for value in row] for row in _stock_export_rows(envoi, taux))
+        return _csv_streaming_response("stock.csv", _STOCK_EXPORT_HEADER, rows)
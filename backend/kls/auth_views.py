@@ -7,6 +7,17 @@ from inventory.audit import log_audit_event
 from inventory.models import AuditEvent
 
 
+class _RequestWithUser:
+    # L'utilisateur n'est pas encore authentifié sur la requête pendant le login.
+    __slots__ = ("user", "META", "path", "method")
+
+    def __init__(self, req, user_obj):
+        self.user = user_obj
+        self.META = getattr(req, "META", {})
+        self.path = getattr(req, "path", "")
+        self.method = getattr(req, "method", "")
+
+
 class LoggingTokenObtainPairView(TokenObtainPairView):
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -19,13 +30,6 @@ class LoggingTokenObtainPairView(TokenObtainPairView):
             or ""
         )
 
-        class _RequestWithUser:
-            def __init__(self, req, user_obj):
-                self.user = user_obj
-                self.META = getattr(req, "META", {})
-                self.path = getattr(req, "path", "")
-                self.method = getattr(req, "method", "")
-
         log_audit_event(
             _RequestWithUser(request, user),
             action=AuditEvent.Action.LOGIN,
@@ -17,6 +17,12 @@ def _env_bool(name: str, default: bool = False) -> bool:
     return str(raw).strip().lower() in {"1", "true", "yes", "y", "on"}
 
 
+def _env_list(name: str, default: str = "") -> tuple[str, ...]:
+    # Liste séparée par des virgules ; les entrées vides sont ignorées.
+    raw = os.environ.get(name, default)
+    return tuple(item for item in (part.strip() for part in raw.split(",")) if item)
+
+
 def _load_or_create_secret_key() -> str:
     env_value = os.environ.get("DJANGO_SECRET_KEY")
     if env_value and env_value.strip() and env_value.strip() not in {"change-me", "change_me"}:
@@ -42,15 +48,8 @@ def _load_or_create_secret_key() -> str:
 SECRET_KEY = _load_or_create_secret_key()
 DEBUG = _env_bool("DJANGO_DEBUG", False)
 
-allowed_hosts_raw = os.environ.get("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1")
-ALLOWED_HOSTS = [h.strip() for h in allowed_hosts_raw.split(",") if h.strip()]
-
-csrf_trusted_origins_raw = os.environ.get("DJANGO_CSRF_TRUSTED_ORIGINS", "")
-CSRF_TRUSTED_ORIGINS = [
-    origin.strip()
-    for origin in csrf_trusted_origins_raw.split(",")
-    if origin.strip()
-]
+ALLOWED_HOSTS = _env_list("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1")
+CSRF_TRUSTED_ORIGINS = _env_list("DJANGO_CSRF_TRUSTED_ORIGINS")
 
 TIME_ZONE = os.environ.get("DJANGO_TIME_ZONE", "UTC")
 LANGUAGE_CODE = "fr-fr"
@@ -195,6 +194,11 @@ SIMPLE_JWT = {
     "UPDATE_LAST_LOGIN": True,
 }
 
+# Écriture de l'audit log en tâche de fond (par lots) plutôt que dans la requête.
+AUDIT_ASYNC = _env_bool("DJANGO_AUDIT_ASYNC", True)
+AUDIT_ENABLED = _env_bool("DJANGO_AUDIT_ENABLED", True)
+AUDIT_DISABLED_ACTIONS = tuple(action.lower() for action in _env_list("DJANGO_AUDIT_DISABLED_ACTIONS"))
+
 if not DEBUG:
     if SECRET_KEY in {"change-me", "change_me"} or len(SECRET_KEY) < 32:
         raise ImproperlyConfigured(